@@ -0,0 +1,826 @@
+"""
+In-memory caches in front of the database
+
+Each cache holds data that is read on hot paths but changes rarely. The
+commands that change the data invalidate the cache, and a TTL catches any
+change made behind the bot's back.
+"""
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set, Tuple
+import discord
+from config import CACHE
+import repository
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Cache")
+
+def approx_size(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """Approximate the memory used by an object and everything it holds, in bytes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(key, seen) + approx_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(approx_size(getattr(obj, slot, None), seen) for slot in obj.__slots__)
+    return size
+
+class CacheStats:
+    """
+    Counters of a cache
+
+    Hits are lookups answered from memory and misses are lookups that had to
+    go to the database or Discord. Evictions count entries dropped before
+    they expired, by the size limit or by an invalidation.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """Share of lookups that were hits, or None before the first lookup"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+class Cache:
+    """Base class that gives every cache its counters and size report"""
+
+    # Shown in /cache-statistikk
+    label = "Cache"
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def _contents(self) -> Any:
+        """The container that holds the cached entries"""
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """Number of cached entries"""
+        return len(self._contents())
+
+    def memory(self) -> int:
+        """Approximate memory used by the cached entries, in bytes"""
+        return approx_size(self._contents())
+
+class PermissionCache(Cache):
+    """Function-to-role assignments per guild, used by every permission check"""
+
+    label = "Rolletillatelser"
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self._guilds: Dict[int, Tuple[float, Dict[str, int]]] = {}
+        # Bumped on every invalidation so a load that raced with it is discarded
+        self._generation = 0
+
+    async def load(self):
+        """Load the assignments of every guild, used at startup"""
+        generation = self._generation
+        permissions = await repository.get_all_role_permissions()
+        if generation != self._generation:
+            return
+        loaded_at = time.monotonic()
+        self._guilds = {guild_id: (loaded_at, functions) for guild_id, functions in permissions.items()}
+        logger.info(f"Loaded role permissions for {len(permissions)} guild(s)")
+
+    async def get_role_id(self, guild_id: int, function: str) -> Optional[int]:
+        """
+        Get the role ID assigned to a function in a guild
+
+        Args:
+            guild_id: The guild to look up
+            function: The function to look up, e.g. "judge"
+
+        Returns:
+            int: The role ID, or None if no role is assigned
+        """
+        entry = self._guilds.get(guild_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+            generation = self._generation
+            functions = await repository.get_role_permissions(guild_id)
+            entry = (time.monotonic(), functions)
+            if generation == self._generation:
+                self._guilds[guild_id] = entry
+        return entry[1].get(function)
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        """Drop the cached assignments of one guild, or of every guild"""
+        self._generation += 1
+        if guild_id is None:
+            self.stats.evictions += len(self._guilds)
+            self._guilds.clear()
+        elif self._guilds.pop(guild_id, None) is not None:
+            self.stats.evictions += 1
+
+    def _contents(self):
+        return self._guilds
+
+class JudgeRegistry(Cache):
+    """Registered judges by user ID, used by every judge check"""
+
+    label = "Dommere"
+
+    def __init__(self):
+        super().__init__()
+        self._judges: Dict[int, repository.Judge] = {}
+        self._loaded = False
+        # Bumped on every change so a load that raced with it reads again
+        self._generation = 0
+        # The load in flight, shared by every lookup that misses meanwhile
+        self._loading: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Load every judge from the database, used at startup"""
+        if self._loading is None:
+            self._loading = asyncio.create_task(self._load())
+        # Shielded, so a cancelled lookup does not cancel the others' load
+        await asyncio.shield(self._loading)
+
+    async def _load(self):
+        try:
+            while True:
+                generation = self._generation
+                judges = await repository.get_judges()
+                if generation == self._generation:
+                    break
+            self._judges = {judge.user_id: judge for judge in judges}
+            self._loaded = True
+            logger.info(f"Loaded {len(self._judges)} judge(s)")
+        finally:
+            self._loading = None
+
+    async def get(self, user_id: int) -> Optional[repository.Judge]:
+        """Get a judge by user ID, or None if the user is not a judge"""
+        if self._loaded:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+            await self.load()
+        return self._judges.get(user_id)
+
+    async def is_judge(self, user_id: int) -> bool:
+        """Check if a user is registered as a judge"""
+        return await self.get(user_id) is not None
+
+    def put(self, judge: repository.Judge):
+        """Add or replace a judge after it has been saved"""
+        self._generation += 1
+        self._judges[judge.user_id] = judge
+
+    def remove(self, user_id: int):
+        """Forget a judge after it has been deleted"""
+        self._generation += 1
+        self._judges.pop(user_id, None)
+
+    def invalidate(self):
+        """Reload every judge on the next lookup, called when another process changed one"""
+        self._generation += 1
+        self.stats.evictions += len(self._judges)
+        self._loaded = False
+
+    def _contents(self):
+        return self._judges
+
+class RoleCache(Cache):
+    """Role IDs by guild and role name, so roles are found without scanning guild.roles"""
+
+    label = "Roller"
+
+    def __init__(self):
+        super().__init__()
+        # None records that the guild has no role with that name
+        self._ids: Dict[Tuple[int, str], Optional[int]] = {}
+
+    def get(self, guild: discord.Guild, name: str) -> Optional[discord.Role]:
+        """
+        Get a guild's role by name
+
+        Args:
+            guild: The guild to look in
+            name: The role name, e.g. "Dommer"
+
+        Returns:
+            discord.Role: The role, or None if the guild has no role with that name
+        """
+        key = (guild.id, name)
+        if key in self._ids:
+            role_id = self._ids[key]
+            if role_id is None:
+                self.stats.hits += 1
+                return None
+            role = guild.get_role(role_id)
+            if role is not None and role.name == name:
+                self.stats.hits += 1
+                return role
+
+        self.stats.misses += 1
+        role = discord.utils.get(guild.roles, name=name)
+        self._ids[key] = role.id if role else None
+        return role
+
+    def invalidate(self, guild_id: int):
+        """Drop every cached role ID of a guild, called when its roles change"""
+        for key in [key for key in self._ids if key[0] == guild_id]:
+            del self._ids[key]
+            self.stats.evictions += 1
+
+    def _contents(self):
+        return self._ids
+
+class CaseCache(Cache):
+    """
+    Bounded LRU cache from channel ID to case, for in-channel commands
+
+    Writes that change a case go through this cache, which writes to the
+    database first and then updates the cached case. Channels that have no
+    case are cached as well, so commands and live capture in other channels
+    do not query. They are kept in an LRU of their own, so a busy guild's
+    other channels cannot push the cases out.
+    """
+
+    label = "Saker per kanal"
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        self._cases: "OrderedDict[int, repository.Case]" = OrderedDict()
+        self._no_case: "OrderedDict[int, None]" = OrderedDict()
+        # Generation of each lookup in flight, by channel. Writes and
+        # invalidations drop the channel's entry, so a lookup that raced with
+        # them does not store what it read over newer data
+        self._loading: Dict[int, int] = {}
+        self._generation = 0
+
+    def _store(self, channel_id: int, case: Optional[repository.Case]):
+        self._loading.pop(channel_id, None)
+        if case is None:
+            self._cases.pop(channel_id, None)
+            entries = self._no_case
+        else:
+            self._no_case.pop(channel_id, None)
+            entries = self._cases
+        entries[channel_id] = case
+        entries.move_to_end(channel_id)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _contents(self):
+        return self._cases, self._no_case
+
+    def size(self) -> int:
+        return len(self._cases) + len(self._no_case)
+
+    async def preload(self):
+        """Cache the newest active cases, used at startup"""
+        cases = await repository.get_active_cases(self.max_size)
+        # Oldest first, so the newest cases end up most recently used
+        for case in reversed(cases):
+            if case.channel_id not in self._cases:
+                self._store(case.channel_id, case)
+        logger.info(f"Preloaded {len(cases)} active case(s)")
+
+    async def get_by_channel(self, channel_id: int) -> Optional[repository.Case]:
+        """Get the case that belongs to a channel, or None if it is not a case channel"""
+        for entries in (self._cases, self._no_case):
+            if channel_id in entries:
+                self.stats.hits += 1
+                entries.move_to_end(channel_id)
+                return entries[channel_id]
+
+        self.stats.misses += 1
+        self._generation += 1
+        generation = self._loading[channel_id] = self._generation
+        try:
+            case = await repository.get_case_by_channel(channel_id)
+        except BaseException:
+            if self._loading.get(channel_id) == generation:
+                del self._loading[channel_id]
+            raise
+        if self._loading.get(channel_id) == generation:
+            self._store(channel_id, case)
+        return case
+
+    async def open_reserved(self, case_id: int, channel_id: int):
+        """Attach a channel to a reserved case, open it and cache it"""
+        await repository.open_reserved_case(case_id, channel_id)
+        responses.bump(case_id)
+        self._store(channel_id, await repository.get_case(case_id))
+
+    async def claim(self, case: repository.Case, judge_id: int, category_id: int):
+        """Assign a case to a judge and move it to the judge's category, LookupError if it is archived"""
+        await repository.claim_case(case.channel_id, judge_id, category_id)
+        case.assigned_judge_id = judge_id
+        case.category_id = category_id
+        case.status = 'Under behandling'
+        responses.bump(case.id)
+        self._store(case.channel_id, case)
+
+    async def move(self, case: repository.Case, category_id: int):
+        """Record that a case channel has moved to another category, LookupError if it is archived"""
+        await repository.move_case(case.channel_id, category_id)
+        case.category_id = category_id
+        responses.bump(case.id)
+        self._store(case.channel_id, case)
+
+    async def close(self, case: repository.Case, closing_reason: Optional[str] = None, archive_url: Optional[str] = None):
+        """Mark a case as closed, optionally recording the reason and archive URL, LookupError if it is archived"""
+        case.closed_at = await repository.close_case(case.channel_id, closing_reason, archive_url)
+        case.status = 'Lukket'
+        if closing_reason is not None:
+            case.closing_reason = closing_reason
+        if archive_url is not None:
+            case.archive_url = archive_url
+        responses.bump(case.id)
+        self._store(case.channel_id, case)
+
+    def invalidate(self, channel_id: int):
+        """Forget a channel, called when it is deleted or has become a case channel"""
+        self._loading.pop(channel_id, None)
+        if channel_id in self._no_case:
+            del self._no_case[channel_id]
+            self.stats.evictions += 1
+        case = self._cases.pop(channel_id, None)
+        if case is not None:
+            self.stats.evictions += 1
+            responses.bump(case.id)
+
+    def invalidate_case(self, case_id: int):
+        """Forget a case by ID, called when another process changed it"""
+        # The case's channel is not known here, so no lookup in flight can be trusted
+        self._loading.clear()
+        for channel_id in [channel_id for channel_id, case in self._cases.items() if case.id == case_id]:
+            del self._cases[channel_id]
+            self.stats.evictions += 1
+        responses.bump(case_id)
+
+class GuildConfigCache(Cache):
+    """
+    Per-guild configuration, so archive targets and roles are found by ID
+
+    Each resolver looks the target up by its stored ID. When no ID is stored,
+    or the channel or role it points at is gone, it falls back to the old
+    lookup by name and stores whatever it finds for next time.
+    """
+
+    label = "Serveroppsett"
+
+    def __init__(self):
+        super().__init__()
+        self._configs: Dict[int, repository.GuildConfig] = {}
+
+    def _contents(self):
+        return self._configs
+
+    async def load(self):
+        """Load the configuration of every guild, used at startup"""
+        self._configs = await repository.get_guild_configs()
+        logger.info(f"Loaded configuration for {len(self._configs)} guild(s)")
+
+    def get(self, guild_id: int) -> repository.GuildConfig:
+        """Get a guild's configuration, with every field None if it has none"""
+        config = self._configs.get(guild_id)
+        if config is None:
+            config = repository.GuildConfig(guild_id, None, None, None, None, None)
+        return config
+
+    async def set(self, guild_id: int, **values: Optional[int]):
+        """Store fields of a guild's configuration and update the cached copy"""
+        await repository.set_guild_config(guild_id, **values)
+        config = self.get(guild_id)
+        for field, value in values.items():
+            setattr(config, field, value)
+        self._configs[guild_id] = config
+
+    async def reload(self, guild_id: int):
+        """Read a guild's configuration again, called when another process changed it"""
+        config = await repository.get_guild_config(guild_id)
+        if config is None:
+            self._configs.pop(guild_id, None)
+        else:
+            self._configs[guild_id] = config
+        self.stats.evictions += 1
+
+    async def _remember(self, guild_id: int, field: str, target_id: Optional[int]):
+        if target_id is not None and getattr(self.get(guild_id), field) != target_id:
+            await self.set(guild_id, **{field: target_id})
+
+    async def archive_category(self, guild: discord.Guild) -> Optional[discord.CategoryChannel]:
+        """Get the guild's archive category, or None if it has none"""
+        category_id = self.get(guild.id).archive_category_id
+        if category_id is not None:
+            category = guild.get_channel(category_id)
+            if isinstance(category, discord.CategoryChannel):
+                self.stats.hits += 1
+                return category
+
+        self.stats.misses += 1
+        category = None
+        archive = await repository.get_category_by_name("Arkiv")
+        if archive:
+            category = guild.get_channel(archive.category_id)
+        if not isinstance(category, discord.CategoryChannel):
+            category = discord.utils.get(guild.categories, name="Arkiv")
+        await self._remember(guild.id, "archive_category_id", category.id if category else None)
+        return category
+
+    async def archive_log(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
+        """Get the guild's archive log channel, or None if it has none"""
+        channel_id = self.get(guild.id).archive_log_channel_id
+        if channel_id is not None:
+            channel = guild.get_channel(channel_id)
+            if isinstance(channel, discord.TextChannel):
+                self.stats.hits += 1
+                return channel
+
+        self.stats.misses += 1
+        archive_category = await self.archive_category(guild)
+        if not archive_category:
+            return None
+        channel = discord.utils.get(archive_category.text_channels, name="arkiv-logg")
+        await self._remember(guild.id, "archive_log_channel_id", channel.id if channel else None)
+        return channel
+
+    async def role(self, guild: discord.Guild, field: str, name: str) -> Optional[discord.Role]:
+        """
+        Get a configured role of a guild
+
+        Args:
+            guild: The guild to look in
+            field: The configuration field, "judge_role_id" or "admin_role_id"
+            name: The role name to fall back to, e.g. "Dommer"
+
+        Returns:
+            discord.Role: The role, or None if the guild has none
+        """
+        role_id = getattr(self.get(guild.id), field)
+        if role_id is not None:
+            role = guild.get_role(role_id)
+            if role is not None:
+                self.stats.hits += 1
+                return role
+
+        self.stats.misses += 1
+        role = roles.get(guild, name)
+        await self._remember(guild.id, field, role.id if role else None)
+        return role
+
+class MemberCache(Cache):
+    """
+    Display names and avatars of members, for listings and transcripts
+
+    A lookup takes members from the guild's member cache first. Members the
+    gateway has not sent are fetched in batches, and members who have left
+    fall back to the profile stored when they left. Results are kept for a
+    TTL, and members nothing is known about are cached as misses.
+    """
+
+    # Discord returns at most this many members per query
+    QUERY_BATCH_SIZE = 100
+
+    label = "Medlemmer"
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self._profiles: Dict[Tuple[int, int], Tuple[float, Optional[repository.MemberProfile]]] = {}
+
+    @staticmethod
+    def profile_of(member: discord.abc.User) -> repository.MemberProfile:
+        """Make a profile from a member or user object"""
+        return repository.MemberProfile(member.id, member.display_name, member.display_avatar.url)
+
+    def put(self, guild_id: int, member: discord.abc.User) -> repository.MemberProfile:
+        """Cache the current profile of a member"""
+        profile = self.profile_of(member)
+        self._profiles[(guild_id, member.id)] = (time.monotonic(), profile)
+        return profile
+
+    async def resolve(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, repository.MemberProfile]:
+        """
+        Get the profiles of several members of a guild
+
+        Args:
+            guild: The guild the members belong to
+            user_ids: The members to look up, duplicates and None are ignored
+
+        Returns:
+            Dict[int, MemberProfile]: Profiles keyed by user ID. Members nothing
+            is known about are left out.
+        """
+        now = time.monotonic()
+        profiles: Dict[int, repository.MemberProfile] = {}
+        missing: List[int] = []
+
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id is not None):
+            entry = self._profiles.get((guild.id, user_id))
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.stats.hits += 1
+                if entry[1] is not None:
+                    profiles[user_id] = entry[1]
+                continue
+            self.stats.misses += 1
+            member = guild.get_member(user_id)
+            if member is not None:
+                profiles[user_id] = self.put(guild.id, member)
+            else:
+                missing.append(user_id)
+
+        if not missing:
+            return profiles
+
+        # Ask the gateway for members that are not in the member cache
+        for start in range(0, len(missing), self.QUERY_BATCH_SIZE):
+            batch = missing[start:start + self.QUERY_BATCH_SIZE]
+            try:
+                members = await guild.query_members(limit=len(batch), user_ids=batch)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                logger.warning(f"Could not query {len(batch)} member(s) of guild {guild.id}: {e}")
+                continue
+            for member in members:
+                profiles[member.id] = self.put(guild.id, member)
+
+        # Members who have left are shown with the profile stored when they left
+        missing = [user_id for user_id in missing if user_id not in profiles]
+        if missing:
+            stored = await repository.get_member_profiles(guild.id, missing)
+            now = time.monotonic()
+            for user_id in missing:
+                profile = stored.get(user_id)
+                self._profiles[(guild.id, user_id)] = (now, profile)
+                if profile is not None:
+                    profiles[user_id] = profile
+
+        return profiles
+
+    async def get(self, guild: discord.Guild, user_id: Optional[int]) -> Optional[repository.MemberProfile]:
+        """Get the profile of one member, or None if nothing is known about them"""
+        return (await self.resolve(guild, [user_id])).get(user_id)
+
+    async def name(self, guild: discord.Guild, user_id: Optional[int], default: str = "Ukjent") -> str:
+        """Get the display name of one member, or the default if nothing is known about them"""
+        profile = await self.get(guild, user_id)
+        return profile.display_name if profile else default
+
+    async def remember(self, member: discord.Member):
+        """Store the profile of a member who is leaving, so they are still shown by name"""
+        await repository.save_member_profile(member.guild.id, self.put(member.guild.id, member))
+
+    def invalidate(self, guild_id: int, user_id: int):
+        """Forget a member, called when their name or avatar changes"""
+        if self._profiles.pop((guild_id, user_id), None) is not None:
+            self.stats.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        """Forget a user in every guild, called when another process stored their profile"""
+        for key in [key for key in self._profiles if key[1] == user_id]:
+            del self._profiles[key]
+            self.stats.evictions += 1
+
+    def _contents(self):
+        return self._profiles
+
+class EmbedCache(Cache):
+    """
+    Rendered case and evidence embeds, so repeated views skip the queries
+
+    Embeds are stored as dicts, keyed by kind, guild and case ID, together
+    with the case's data version at the time they were built. Anything that
+    changes a case or its evidence bumps the version, which makes the stored
+    embeds stale. The TTL refreshes member names and channel links.
+
+    Versions are kept in an LRU as large as the one for embeds. They are taken
+    from one counter and only grow, and a case whose version was evicted gets
+    the highest evicted version, so it never goes back to one an embed built
+    from older data could carry.
+    """
+
+    label = "Embeds"
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._embeds: "OrderedDict[Tuple[str, int, int], Tuple[float, int, dict]]" = OrderedDict()
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._counter = 0
+        # The version of every case without an entry in _versions
+        self._evicted_version = 0
+
+    def version(self, case_id: int) -> int:
+        """Get the current data version of a case"""
+        return self._versions.get(case_id, self._evicted_version)
+
+    def bump(self, case_id: int):
+        """Mark every embed of a case as stale, called when the case or its evidence changes"""
+        self._counter += 1
+        self._versions[case_id] = self._counter
+        self._versions.move_to_end(case_id)
+        while len(self._versions) > self.max_size:
+            _, version = self._versions.popitem(last=False)
+            self._evicted_version = max(self._evicted_version, version)
+            self.stats.evictions += 1
+
+    def get(self, kind: str, guild_id: int, case_id: int) -> Optional[discord.Embed]:
+        """
+        Get a rendered embed if it is still current
+
+        Args:
+            kind: What the embed shows, e.g. "evidence"
+            guild_id: The guild the embed was rendered for
+            case_id: The case the embed belongs to
+
+        Returns:
+            discord.Embed: A fresh copy of the embed, or None if it must be rebuilt
+        """
+        key = (kind, guild_id, case_id)
+        entry = self._embeds.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        stored_at, version, data = entry
+        if version != self.version(case_id) or time.monotonic() - stored_at > self.ttl:
+            self.stats.misses += 1
+            del self._embeds[key]
+            return None
+        self.stats.hits += 1
+        self._embeds.move_to_end(key)
+        return discord.Embed.from_dict(data)
+
+    def put(self, kind: str, guild_id: int, case_id: int, version: int, embed: discord.Embed):
+        """
+        Store a rendered embed
+
+        Args:
+            kind: What the embed shows, e.g. "evidence"
+            guild_id: The guild the embed was rendered for
+            case_id: The case the embed belongs to
+            version: The case's version from before the embed's data was read,
+                so an embed built while the case changed is not stored
+            embed: The rendered embed
+        """
+        if version != self.version(case_id):
+            return
+        key = (kind, guild_id, case_id)
+        self._embeds[key] = (time.monotonic(), version, embed.to_dict())
+        self._embeds.move_to_end(key)
+        while len(self._embeds) > self.max_size:
+            self._embeds.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _contents(self):
+        return self._embeds, self._versions
+
+    def size(self) -> int:
+        return len(self._embeds) + len(self._versions)
+
+permissions = PermissionCache(CACHE["permission_ttl"])
+judges = JudgeRegistry()
+roles = RoleCache()
+cases = CaseCache(CACHE["case_cache_size"])
+guilds = GuildConfigCache()
+members = MemberCache(CACHE["member_ttl"])
+responses = EmbedCache(CACHE["embed_cache_size"], CACHE["embed_ttl"])
+
+class InvalidationBus:
+    """
+    Keeps the caches coherent with other processes sharing the database
+
+    Writes record what they changed in the cache_invalidations table, see
+    repository.py. The bus polls that log and drops the entries other
+    processes made stale.
+    """
+
+    # Most log entries read per query
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self.last_id: Optional[int] = None
+        self.applied = 0
+
+    async def start(self):
+        """Start from the end of the log, called before the caches are loaded"""
+        self.last_id = await repository.get_last_invalidation_id()
+
+    async def poll(self) -> int:
+        """
+        Apply the invalidations other processes wrote since the last poll
+
+        Returns:
+            int: The number of invalidations applied
+        """
+        if self.last_id is None:
+            await self.start()
+            return 0
+
+        applied = 0
+        while True:
+            batch = await repository.get_invalidations(self.last_id, self.BATCH_SIZE)
+            for invalidation in batch:
+                await self._apply(invalidation)
+                self.last_id = invalidation.id
+            applied += len(batch)
+            if len(batch) < self.BATCH_SIZE:
+                break
+
+        if applied:
+            self.applied += applied
+            logger.debug(f"Applied {applied} invalidation(s) from other processes")
+        return applied
+
+    async def _apply(self, invalidation: repository.Invalidation):
+        topic, key = invalidation.topic, invalidation.key
+        if topic == repository.TOPIC_PERMISSIONS:
+            permissions.invalidate(key)
+        elif topic == repository.TOPIC_JUDGE:
+            judges.invalidate()
+        elif topic == repository.TOPIC_GUILD_CONFIG:
+            await guilds.reload(key)
+        elif topic == repository.TOPIC_CASE:
+            cases.invalidate_case(key)
+        elif topic == repository.TOPIC_CASE_CHANNEL:
+            cases.invalidate(key)
+        elif topic == repository.TOPIC_MEMBER:
+            members.invalidate_user(key)
+        else:
+            logger.warning(f"Unknown invalidation topic '{topic}'")
+
+bus = InvalidationBus()
+
+def all_caches() -> List[Cache]:
+    """Every cache, in the order they are reported"""
+    return [permissions, judges, roles, guilds, cases, members, responses]
+
+# Set once the startup warm-up has finished, see warm_up()
+_warm: Optional[asyncio.Event] = None
+
+def _warm_event() -> asyncio.Event:
+    # Created on first use, so it belongs to the running event loop
+    global _warm
+    if _warm is None:
+        _warm = asyncio.Event()
+    return _warm
+
+def is_warm() -> bool:
+    """Check if the startup warm-up has finished"""
+    return _warm is not None and _warm.is_set()
+
+async def wait_warm(timeout: float) -> bool:
+    """
+    Wait for the startup warm-up to finish
+
+    Args:
+        timeout: Seconds to wait at most
+
+    Returns:
+        bool: True if the caches are warm, False if the wait timed out
+    """
+    try:
+        await asyncio.wait_for(_warm_event().wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+async def warm_up(*loaders: Awaitable):
+    """
+    Fill the caches concurrently and mark them as warm
+
+    A loader that fails is logged and skipped; its cache fills on demand
+    instead.
+
+    Args:
+        *loaders: Extra loads to run alongside the caches, e.g. ticket buttons
+    """
+    started = time.monotonic()
+    # Changes made by other processes while the caches load are replayed later
+    await bus.start()
+    results = await asyncio.gather(
+        permissions.load(),
+        judges.load(),
+        guilds.load(),
+        cases.preload(),
+        *loaders,
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Cache warm-up step failed: {result}")
+    _warm_event().set()
+    logger.info(f"Caches warmed up in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,135 @@
+import discord
+from discord.ext import commands
+import logging
+from typing import List
+from config import TRANSCRIPTS
+import repository
+import cache
+import transcript
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Capture")
+
+# Messages stored per commit while catching up on a channel
+CATCH_UP_BATCH_SIZE = 100
+
+class Capture(commands.Cog):
+    """
+    Live capture of case channel messages
+
+    With TRANSCRIPTS["live_capture"] on, every message, edit and delete in a
+    case channel is applied to the local message store as it happens, so
+    exports and closing a case read the store instead of Discord.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.catching_up = False
+
+    async def _is_case_channel(self, channel_id: int) -> bool:
+        return await cache.cases.get_by_channel(channel_id) is not None
+
+    async def start_channel(self, channel_id: int, messages: List[discord.Message]):
+        """
+        Start capturing a new case channel
+
+        Args:
+            channel_id: The new channel
+            messages: Messages the bot posted before the channel was a case channel
+        """
+        if not TRANSCRIPTS["live_capture"]:
+            return
+        await repository.save_captured_messages([transcript.capture(message) for message in messages])
+        await repository.mark_channel_captured(channel_id)
+
+    async def catch_up(self):
+        """Store messages posted while the bot was offline, and the history of channels not captured yet"""
+        cursors = await repository.get_capture_cursors()
+        caught_up = 0
+
+        for cursor in cursors:
+            channel = self.bot.get_channel(cursor.channel_id)
+            if channel is None:
+                continue
+
+            # Channels captured from the start only need what is newer than the store
+            after = None
+            if cursor.complete and cursor.last_message_id:
+                after = discord.Object(id=cursor.last_message_id)
+
+            try:
+                batch = []
+                async for message in channel.history(limit=None, after=after, oldest_first=True):
+                    batch.append(transcript.capture(message))
+                    if len(batch) >= CATCH_UP_BATCH_SIZE:
+                        await repository.save_captured_messages(batch)
+                        batch = []
+                await repository.save_captured_messages(batch)
+                await repository.mark_channel_captured(cursor.channel_id)
+                caught_up += 1
+            except discord.HTTPException as e:
+                logger.error(f"Error catching up on channel {cursor.channel_id}: {e}")
+
+        logger.info(f"Caught up on {caught_up} case channel(s)")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Catch up on every active case channel, also after a reconnect"""
+        if not TRANSCRIPTS["live_capture"] or self.catching_up:
+            return
+        self.catching_up = True
+        try:
+            await self.catch_up()
+        finally:
+            self.catching_up = False
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Store a new message in a case channel"""
+        if not TRANSCRIPTS["live_capture"] or message.guild is None:
+            return
+        if await self._is_case_channel(message.channel.id):
+            await repository.save_captured_messages([transcript.capture(message)])
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """Apply an edit, also to messages that are not in the message cache"""
+        if not TRANSCRIPTS["live_capture"] or payload.guild_id is None:
+            return
+        if not await self._is_case_channel(payload.channel_id):
+            return
+
+        # Only the parts that are present in the update have changed. None keeps
+        # the stored value, so an emptied list is stored as "[]"
+        data = payload.data
+        embeds = attachments = None
+        if "embeds" in data:
+            embeds = transcript.compact_embeds(data["embeds"]) or "[]"
+        if "attachments" in data:
+            attachments = transcript.compact_attachments([a["url"] for a in data["attachments"]]) or "[]"
+        await repository.update_captured_message(payload.message_id, data.get("content"), embeds, attachments)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Remove a deleted message"""
+        if not TRANSCRIPTS["live_capture"] or payload.guild_id is None:
+            return
+        if await self._is_case_channel(payload.channel_id):
+            await repository.delete_captured_messages([payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Remove messages deleted together"""
+        if not TRANSCRIPTS["live_capture"] or payload.guild_id is None:
+            return
+        if await self._is_case_channel(payload.channel_id):
+            await repository.delete_captured_messages(list(payload.message_ids))
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        """Drop the stored messages of a deleted channel"""
+        if TRANSCRIPTS["live_capture"]:
+            await repository.forget_captured_channel(channel.id)
+
+async def setup(bot):
+    await bot.add_cog(Capture(bot))
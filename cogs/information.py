@@ -3,9 +3,11 @@ from discord import app_commands
 from discord.ext import commands
 import datetime
 import logging
-import sqlite3
 import os
 import config
+import repository
+import cache
+import embeds
 
 logger = logging.getLogger('discord')
 
@@ -15,12 +17,6 @@ class Information(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
-    def get_db_connection(self):
-        """Get a connection to the SQLite database"""
-        conn = sqlite3.connect('court.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    
     @app_commands.command(name="sak-info", description="Viser informasjon om en spesifikk sak")
     @app_commands.describe(
         sak_id="ID-nummeret til saken du vil se informasjon om"
@@ -34,76 +30,70 @@ class Information(commands.Cog):
         """
         await interaction.response.defer(ephemeral=True)
         
-        # Get case from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM cases WHERE id = ?
-        ''', (sak_id,))
+        # Serve the embed from memory if the case and its evidence have not changed
+        embed = cache.responses.get("case_info", interaction.guild.id, sak_id)
+        if embed:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            logger.info(f"Case info for case {sak_id} viewed by {interaction.user}")
+            return
+        version = cache.responses.version(sak_id)
         
-        case = c.fetchone()
+        # Get case from database
+        case = await repository.get_case(sak_id)
         
         if not case:
             await interaction.followup.send(f"Fant ingen sak med ID #{sak_id}.", ephemeral=True)
-            conn.close()
             return
         
         # Get evidence count
-        c.execute('''
-        SELECT COUNT(*) as count FROM evidence WHERE case_id = ?
-        ''', (sak_id,))
-        
-        evidence_count = c.fetchone()['count']
+        evidence_count = await repository.count_evidence(sak_id)
         
         # Get judge information if assigned
+        profiles = await cache.members.resolve(interaction.guild, (case.assigned_judge_id, case.creator_id))
         judge_name = "Ingen"
-        if case['assigned_judge_id']:
-            judge_member = interaction.guild.get_member(case['assigned_judge_id'])
-            if judge_member:
-                judge_name = judge_member.display_name
+        if case.assigned_judge_id in profiles:
+            judge_name = profiles[case.assigned_judge_id].display_name
         
         # Get creator information
         creator_name = "Ukjent"
-        creator_member = interaction.guild.get_member(case['creator_id'])
-        if creator_member:
-            creator_name = creator_member.display_name
+        if case.creator_id in profiles:
+            creator_name = profiles[case.creator_id].display_name
         
         # Create embed
         embed = discord.Embed(
-            title=f"Sak #{case['id']} - {case['title']}",
-            description=case['description'],
-            color=config.COLORS.get(case['status'], discord.Color.default())
+            title=f"Sak #{case.id} - {case.title}",
+            description=case.description,
+            color=config.COLORS.get(case.status, discord.Color.default())
         )
         
         # Add fields
-        embed.add_field(name="Status", value=case['status'], inline=True)
+        embed.add_field(name="Status", value=case.status, inline=True)
         embed.add_field(name="Opprettet av", value=creator_name, inline=True)
         embed.add_field(name="Tildelt dommer", value=judge_name, inline=True)
-        embed.add_field(name="Opprettet", value=discord.utils.format_dt(datetime.datetime.fromisoformat(case['created_at'])) if case['created_at'] else "Ukjent", inline=True)
+        embed.add_field(name="Opprettet", value=discord.utils.format_dt(datetime.datetime.fromisoformat(case.created_at)) if case.created_at else "Ukjent", inline=True)
         
-        if case['closed_at']:
-            embed.add_field(name="Lukket", value=discord.utils.format_dt(datetime.datetime.fromisoformat(case['closed_at'])), inline=True)
+        if case.closed_at:
+            embed.add_field(name="Lukket", value=discord.utils.format_dt(datetime.datetime.fromisoformat(case.closed_at)), inline=True)
             
-        if case['closing_reason']:
-            embed.add_field(name="Begrunnelse for lukking", value=case['closing_reason'], inline=False)
+        if case.closing_reason:
+            embed.add_field(name="Begrunnelse for lukking", value=case.closing_reason, inline=False)
             
         embed.add_field(name="Antall bevis", value=str(evidence_count), inline=True)
         
         # Add link to channel if it exists
-        if case['channel_id']:
-            channel = interaction.guild.get_channel(case['channel_id'])
+        if case.channel_id:
+            channel = interaction.guild.get_channel(case.channel_id)
             if channel:
                 embed.add_field(name="Kanal", value=channel.mention, inline=True)
         
         # Add link to archive if it exists
-        if case['archive_url']:
-            embed.add_field(name="Arkiv", value=f"[Klikk her for å se arkivert sak]({case['archive_url']})", inline=False)
+        if case.archive_url:
+            embed.add_field(name="Arkiv", value=f"[Klikk her for å se arkivert sak]({case.archive_url})", inline=False)
         
         # Send embed
+        cache.responses.put("case_info", interaction.guild.id, sak_id, version, embed)
         await interaction.followup.send(embed=embed, ephemeral=True)
         logger.info(f"Case info for case {sak_id} viewed by {interaction.user}")
-        conn.close()
     
     @app_commands.command(name="søk-arkiv", description="Søker i arkiverte saker")
     @app_commands.describe(
@@ -119,23 +109,11 @@ class Information(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Search database for cases matching the search term
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
         # Use LIKE for case-insensitive search in both title and description
-        c.execute('''
-        SELECT * FROM cases 
-        WHERE (title LIKE ? OR description LIKE ?) 
-        AND (status = 'Lukket' OR status = 'Arkivert')
-        ORDER BY id DESC
-        LIMIT 10
-        ''', (f'%{søkeord}%', f'%{søkeord}%'))
-        
-        cases = c.fetchall()
+        cases = await repository.search_closed_cases(søkeord, limit=10)
         
         if not cases:
             await interaction.followup.send(f"Fant ingen arkiverte saker som matcher søkeordet '{søkeord}'.", ephemeral=True)
-            conn.close()
             return
         
         # Create embed with search results
@@ -148,14 +126,14 @@ class Information(commands.Cog):
         # Add each case to the embed
         for case in cases:
             # Format the case information
-            case_info = f"**Status:** {case['status']}\n"
-            case_info += f"**Opprettet:** {case['created_at']}\n"
+            case_info = f"**Status:** {case.status}\n"
+            case_info += f"**Opprettet:** {case.created_at}\n"
             
-            if case['archive_url']:
-                case_info += f"[Se arkivert sak]({case['archive_url']})\n"
+            if case.archive_url:
+                case_info += f"[Se arkivert sak]({case.archive_url})\n"
             
             embed.add_field(
-                name=f"Sak #{case['id']} - {case['title']}",
+                name=f"Sak #{case.id} - {case.title}",
                 value=case_info,
                 inline=False
             )
@@ -166,42 +144,14 @@ class Information(commands.Cog):
         # Send embed
         await interaction.followup.send(embed=embed, ephemeral=True)
         logger.info(f"Archive search for '{søkeord}' by {interaction.user}")
-        conn.close()
     
     @app_commands.command(name="statistikk", description="Viser statistikk for saker og dommere")
     async def statistics(self, interaction: discord.Interaction):
         """Shows statistics for cases and judges"""
         await interaction.response.defer(ephemeral=True)
         
-        # Get statistics from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Get case statistics
-        c.execute('''
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN status = 'Åpen' THEN 1 ELSE 0 END) as open,
-            SUM(CASE WHEN status = 'Tildelt' THEN 1 ELSE 0 END) as assigned,
-            SUM(CASE WHEN status = 'Lukket' THEN 1 ELSE 0 END) as closed,
-            SUM(CASE WHEN status = 'Arkivert' THEN 1 ELSE 0 END) as archived
-        FROM cases
-        ''')
-        
-        case_stats = c.fetchone()
-        
-        # Get judge statistics
-        c.execute('''
-        SELECT 
-            j.user_id,
-            COUNT(c.id) as total_cases,
-            SUM(CASE WHEN c.status = 'Lukket' THEN 1 ELSE 0 END) as closed_cases
-        FROM judges j
-        LEFT JOIN cases c ON j.user_id = c.assigned_judge_id
-        GROUP BY j.user_id
-        ''')
-        
-        judge_stats = c.fetchall()
+        # Get case and judge statistics from a single read snapshot
+        case_stats, judge_stats = await repository.get_statistics()
         
         # Create embed for statistics
         embed = discord.Embed(
@@ -213,21 +163,21 @@ class Information(commands.Cog):
         # Add case statistics
         embed.add_field(
             name="Sak Statistikk",
-            value=f"**Totalt antall saker:** {case_stats['total']}\n"
-                  f"**Åpne saker:** {case_stats['open']}\n"
-                  f"**Tildelte saker:** {case_stats['assigned']}\n"
-                  f"**Lukkede saker:** {case_stats['closed']}\n"
-                  f"**Arkiverte saker:** {case_stats['archived']}",
+            value=f"**Totalt antall saker:** {case_stats.total}\n"
+                  f"**Åpne saker:** {case_stats.open}\n"
+                  f"**Tildelte saker:** {case_stats.assigned}\n"
+                  f"**Lukkede saker:** {case_stats.closed}\n"
+                  f"**Arkiverte saker:** {case_stats.archived}",
             inline=False
         )
         
         # Add judge statistics
         judge_info = ""
+        judge_profiles = await cache.members.resolve(interaction.guild, (judge.user_id for judge in judge_stats))
         for judge in judge_stats:
-            if judge['user_id']:  # Skip if user_id is NULL
-                judge_member = interaction.guild.get_member(judge['user_id'])
-                if judge_member:
-                    judge_info += f"**{judge_member.display_name}:** {judge['closed_cases']} avsluttede av {judge['total_cases']} totalt\n"
+            judge_profile = judge_profiles.get(judge.user_id)
+            if judge_profile:
+                judge_info += f"**{judge_profile.display_name}:** {judge.closed_cases} avsluttede av {judge.total_cases} totalt\n"
         
         if judge_info:
             embed.add_field(
@@ -248,76 +198,43 @@ class Information(commands.Cog):
         # Send embed
         await interaction.followup.send(embed=embed, ephemeral=True)
         logger.info(f"Statistics viewed by {interaction.user}")
-        conn.close()
     
-    @app_commands.command(name="hjelp", description="Viser hjelp for kommandoer")
-    async def help_command(self, interaction: discord.Interaction):
-        """Shows help information for commands"""
+    @app_commands.command(name="cache-statistikk", description="Viser treffrate og størrelse for botens hurtigbuffere")
+    @app_commands.default_permissions(administrator=True)
+    async def cache_statistics(self, interaction: discord.Interaction):
+        """Shows hits, misses, evictions, size and memory use of every cache"""
         await interaction.response.defer(ephemeral=True)
         
-        # Create embed for help
         embed = discord.Embed(
-            title="CourtBot Hjelp",
-            description="Her er en oversikt over tilgjengelige kommandoer:",
-            color=discord.Color.blue()
-        )
-        
-        # Setup commands
-        embed.add_field(
-            name="Oppsett",
-            value="**/opprett-kategori** - Oppretter en ny kategori for saker\n"
-                  "**/fjern-kategori** - Fjerner en kategori\n"
-                  "**/legg-til-dommer** - Legger til en dommer\n"
-                  "**/fjern-dommer** - Fjerner en dommer",
-            inline=False
-        )
-        
-        # Ticket commands
-        embed.add_field(
-            name="Saker",
-            value="**/opprett-sak** - Oppretter en ny sak\n"
-                  "**/avslutt-sak** - Avslutter en sak med begrunnelse\n"
-                  "**/arkiver-sak** - Arkiverer en sak uten å lukke den",
-            inline=False
+            title="Hurtigbuffer Statistikk",
+            description="Treff, bom og størrelse for hver hurtigbuffer siden oppstart",
+            color=discord.Color.gold()
         )
         
-        # Judge commands
-        embed.add_field(
-            name="Dommer",
-            value="**/ta-sak** - Tildeler en sak til deg selv som dommer\n"
-                  "**/send-dm** - Sender en DM til en bruker som dommer\n"
-                  "**/mine-saker** - Viser saker tildelt til deg",
-            inline=False
-        )
+        for buffer in cache.all_caches():
+            stats = buffer.stats
+            hit_rate = f"{stats.hit_rate:.1%}" if stats.hit_rate is not None else "Ingen oppslag"
+            embed.add_field(
+                name=buffer.label,
+                value=f"**Treffrate:** {hit_rate}\n"
+                      f"**Treff / bom:** {stats.hits} / {stats.misses}\n"
+                      f"**Fjernet:** {stats.evictions}\n"
+                      f"**Størrelse:** {buffer.size()} ({buffer.memory() / 1024:.1f} KiB)",
+                inline=True
+            )
         
-        # Evidence commands
-        embed.add_field(
-            name="Bevis",
-            value="**/legg-til-bevis** - Legger til bevis i en sak\n"
-                  "**/fjern-bevis** - Fjerner bevis fra en sak\n"
-                  "**/vis-bevis** - Viser alle bevis i en sak\n"
-                  "**/eksporter-sak** - Eksporterer en sak som HTML",
-            inline=False
-        )
+        embed.set_footer(text=f"Generert: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # Notification commands
-        embed.add_field(
-            name="Varsler",
-            value="**/varsle-klient** - Planlegger en DM til en bruker\n"
-                  "**/avbryt-varsel** - Avbryter et planlagt varsel\n"
-                  "**/vis-varsler** - Viser alle planlagte varsler",
-            inline=False
-        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        logger.info(f"Cache statistics viewed by {interaction.user}")
+    
+    @app_commands.command(name="hjelp", description="Viser hjelp for kommandoer")
+    async def help_command(self, interaction: discord.Interaction):
+        """Shows help information for commands"""
+        await interaction.response.defer(ephemeral=True)
         
-        # Information commands
-        embed.add_field(
-            name="Informasjon",
-            value="**/sak-info** - Viser informasjon om en spesifikk sak\n"
-                  "**/søk-arkiv** - Søker i arkiverte saker\n"
-                  "**/statistikk** - Viser statistikk for saker og dommere\n"
-                  "**/hjelp** - Viser denne hjelpeteksten",
-            inline=False
-        )
+        # Built from the command tree once, and again only when it changes
+        embed = embeds.render("help")
         
         # Send embed
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -1,10 +1,11 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import sqlite3
 import logging
 import datetime
 from typing import Optional
+import repository
+import cache
 
 # Set up logging
 logger = logging.getLogger("CourtBot.Notifications")
@@ -15,12 +16,6 @@ class Notifications(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
-    def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect('data/courtbot.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    
     @app_commands.command(name="varsle-klient", description="Planlegger en DM til en bruker på et bestemt tidspunkt")
     @app_commands.describe(
         bruker="Brukeren som skal motta varselet",
@@ -47,18 +42,9 @@ class Notifications(commands.Cog):
             return
         
         # Store notification in database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        INSERT INTO scheduled_notifications (target_user_id, message, scheduled_time, created_by)
-        VALUES (?, ?, ?, ?)
-        ''', (bruker.id, melding, scheduled_time.strftime('%Y-%m-%d %H:%M:%S'), interaction.user.id))
-        
-        notification_id = c.lastrowid
-        
-        conn.commit()
-        conn.close()
+        notification_id = await repository.schedule_notification(
+            bruker.id, melding, scheduled_time.strftime('%Y-%m-%d %H:%M:%S'), interaction.user.id
+        )
         
         # Send confirmation
         await interaction.followup.send(
@@ -77,33 +63,19 @@ class Notifications(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Get notification from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM scheduled_notifications WHERE id = ?
-        ''', (varsel_id,))
-        
-        notification = c.fetchone()
+        notification = await repository.get_notification(varsel_id)
         
         if not notification:
             await interaction.followup.send(f"Fant ikke varsel med ID {varsel_id}.", ephemeral=True)
-            conn.close()
             return
         
         # Check if notification has already been sent
-        if notification['sent']:
+        if notification.sent:
             await interaction.followup.send(f"Varsel #{varsel_id} har allerede blitt sendt og kan ikke avbrytes.", ephemeral=True)
-            conn.close()
             return
         
         # Delete notification
-        c.execute('''
-        DELETE FROM scheduled_notifications WHERE id = ?
-        ''', (varsel_id,))
-        
-        conn.commit()
-        conn.close()
+        await repository.delete_notification(varsel_id)
         
         # Send confirmation
         await interaction.followup.send(f"Varsel #{varsel_id} har blitt avbrutt.")
@@ -116,18 +88,10 @@ class Notifications(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Get notifications from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM scheduled_notifications WHERE sent = 0 ORDER BY scheduled_time
-        ''')
-        
-        notifications = c.fetchall()
+        notifications = await repository.get_pending_notifications()
         
         if not notifications:
             await interaction.followup.send("Det er ingen planlagte varsler.", ephemeral=True)
-            conn.close()
             return
         
         # Create embed with notifications
@@ -137,28 +101,31 @@ class Notifications(commands.Cog):
             color=discord.Color.blue()
         )
         
+        profiles = await cache.members.resolve(
+            interaction.guild,
+            [n.target_user_id for n in notifications] + [n.created_by for n in notifications]
+        )
         for notification in notifications:
-            target_user = interaction.guild.get_member(notification['target_user_id'])
-            creator = interaction.guild.get_member(notification['created_by'])
+            target_user = profiles.get(notification.target_user_id)
+            creator = profiles.get(notification.created_by)
             
-            target_name = target_user.display_name if target_user else f"Bruker (ID: {notification['target_user_id']})"
+            target_name = target_user.display_name if target_user else f"Bruker (ID: {notification.target_user_id})"
             creator_name = creator.display_name if creator else "Ukjent"
             
-            scheduled_time = datetime.datetime.strptime(notification['scheduled_time'], '%Y-%m-%d %H:%M:%S')
+            scheduled_time = datetime.datetime.strptime(notification.scheduled_time, '%Y-%m-%d %H:%M:%S')
             
             embed.add_field(
-                name=f"Varsel #{notification['id']}",
+                name=f"Varsel #{notification.id}",
                 value=(
                     f"**Til:** {target_name}\n"
                     f"**Tidspunkt:** {discord.utils.format_dt(scheduled_time)}\n"
                     f"**Opprettet av:** {creator_name}\n"
-                    f"**Melding:** {notification['message']}"
+                    f"**Melding:** {notification.message}"
                 ),
                 inline=False
             )
         
         await interaction.followup.send(embed=embed, ephemeral=True)
-        conn.close()
 
 async def setup(bot):
     await bot.add_cog(Notifications(bot))
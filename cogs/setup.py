@@ -1,9 +1,11 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import sqlite3
 import logging
 from typing import Optional
+import repository
+import cache
+import embeds
 
 # Set up logging
 logger = logging.getLogger("CourtBot.Setup")
@@ -14,12 +16,6 @@ class Setup(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
-    def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect('data/courtbot.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    
     @app_commands.command(name="oppsett", description="Setter opp CourtBot på serveren")
     @app_commands.default_permissions(administrator=True)
     async def setup(self, interaction: discord.Interaction):
@@ -27,15 +23,10 @@ class Setup(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         guild = interaction.guild
-        conn = self.get_db_connection()
-        c = conn.cursor()
         
         # Check if we already have categories in the database for this guild
-        c.execute('''
-        SELECT category_id, name FROM categories
-        ''')
-        existing_categories = c.fetchall()
-        existing_category_names = {cat['name']: cat['category_id'] for cat in existing_categories}
+        existing_categories = await repository.get_categories()
+        existing_category_names = {cat.name: cat.category_id for cat in existing_categories}
         
         # Initialize variables for categories
         archive_category = None
@@ -48,10 +39,7 @@ class Setup(commands.Cog):
                 logger.info(f"Found existing 'Arkiv' category: {category.id}")
                 
                 # Add to database since it's not there yet
-                c.execute('''
-                INSERT INTO categories (category_id, name, role_id)
-                VALUES (?, ?, ?)
-                ''', (category.id, "Arkiv", 0))
+                await repository.add_category(category.id, "Arkiv")
                 logger.info(f"Added existing 'Arkiv' category to database: {category.id}")
                 
             elif category.name == "Saker" and "Saker" not in existing_category_names:
@@ -59,10 +47,7 @@ class Setup(commands.Cog):
                 logger.info(f"Found existing 'Saker' category: {category.id}")
                 
                 # Add to database since it's not there yet
-                c.execute('''
-                INSERT INTO categories (category_id, name, role_id)
-                VALUES (?, ?, ?)
-                ''', (category.id, "Saker", 0))
+                await repository.add_category(category.id, "Saker")
                 logger.info(f"Added existing 'Saker' category to database: {category.id}")
         
         # If we found existing categories in the database, verify they still exist on Discord
@@ -77,9 +62,7 @@ class Setup(commands.Cog):
                         logger.info(f"Found category {cat_name} with new ID {category.id}, updating database")
                         
                         # Update the database with the new ID
-                        c.execute('''
-                        UPDATE categories SET category_id = ? WHERE name = ?
-                        ''', (category.id, cat_name))
+                        await repository.move_named_category(cat_name, category.id)
                         
                         if cat_name == "Arkiv":
                             archive_category = category
@@ -95,10 +78,7 @@ class Setup(commands.Cog):
                 logger.info(f"Created new 'Arkiv' category: {archive_category.id}")
                 
                 # Store archive category in database
-                c.execute('''
-                INSERT INTO categories (category_id, name, role_id)
-                VALUES (?, ?, ?)
-                ''', (archive_category.id, "Arkiv", 0))
+                await repository.add_category(archive_category.id, "Arkiv")
             except discord.Forbidden:
                 await interaction.followup.send("Feil: Boten har ikke tillatelse til å opprette kategorier. Gi boten 'Administrer kanaler' tillatelse.", ephemeral=True)
             except Exception as e:
@@ -117,9 +97,7 @@ class Setup(commands.Cog):
                     logger.info(f"Recreated 'Arkiv' category: {archive_category.id}")
                     
                     # Update the database with the new category ID
-                    c.execute('''
-                    UPDATE categories SET category_id = ? WHERE name = 'Arkiv'
-                    ''', (archive_category.id,))
+                    await repository.move_named_category("Arkiv", archive_category.id)
                 except discord.Forbidden:
                     await interaction.followup.send("Feil: Boten har ikke tillatelse til å opprette kategorier. Gi boten 'Administrer kanaler' tillatelse.", ephemeral=True)
                 except Exception as e:
@@ -153,10 +131,7 @@ class Setup(commands.Cog):
                 logger.info(f"Created new 'Saker' category: {tickets_category.id}")
                 
                 # Store tickets category in database
-                c.execute('''
-                INSERT INTO categories (category_id, name, role_id)
-                VALUES (?, ?, ?)
-                ''', (tickets_category.id, "Saker", 0))
+                await repository.add_category(tickets_category.id, "Saker")
             except discord.Forbidden:
                 await interaction.followup.send("Feil: Boten har ikke tillatelse til å opprette kategorier. Gi boten 'Administrer kanaler' tillatelse.", ephemeral=True)
             except Exception as e:
@@ -174,9 +149,7 @@ class Setup(commands.Cog):
                     logger.info(f"Recreated 'Saker' category: {tickets_category.id}")
                     
                     # Update the database with the new category ID
-                    c.execute('''
-                    UPDATE categories SET category_id = ? WHERE name = 'Saker'
-                    ''', (tickets_category.id,))
+                    await repository.move_named_category("Saker", tickets_category.id)
                 except discord.Forbidden:
                     await interaction.followup.send("Feil: Boten har ikke tillatelse til å opprette kategorier. Gi boten 'Administrer kanaler' tillatelse.", ephemeral=True)
                 except Exception as e:
@@ -185,16 +158,20 @@ class Setup(commands.Cog):
             else:
                 logger.info(f"Using existing 'Saker' category from database: {tickets_category.id}")
         
+        # Remember what was set up, so later commands find it by ID
+        await cache.guilds.set(
+            guild.id,
+            archive_category_id=archive_category.id if archive_category else None,
+            archive_log_channel_id=archive_channel.id if archive_channel else None,
+            cases_category_id=tickets_category.id if tickets_category else None
+        )
+        await cache.guilds.role(guild, "judge_role_id", "Dommer")
+        await cache.guilds.role(guild, "admin_role_id", "Administrator")
+        
         # Log the current state of the database after setup
-        c.execute('''
-        SELECT * FROM categories
-        ''')
-        categories_after_setup = c.fetchall()
+        categories_after_setup = await repository.get_categories()
         for cat in categories_after_setup:
-            logger.info(f"Category in database after setup: {cat['name']} (ID: {cat['category_id']})")
-        
-        conn.commit()
-        conn.close()
+            logger.info(f"Category in database after setup: {cat.name} (ID: {cat.category_id})")
         
         # Prepare response message
         response_parts = []
@@ -227,10 +204,11 @@ class Setup(commands.Cog):
         guild = interaction.guild
         
         # Create judge role if it doesn't exist
-        judge_role = discord.utils.get(guild.roles, name="Dommer")
+        judge_role = await cache.guilds.role(guild, "judge_role_id", "Dommer")
         if not judge_role:
             try:
                 judge_role = await guild.create_role(name="Dommer", color=discord.Color.from_rgb(50, 100, 150))
+                await cache.guilds.set(guild.id, judge_role_id=judge_role.id)
                 logger.info(f"Created 'Dommer' role in guild {guild.name}")
             except discord.Forbidden:
                 await interaction.followup.send("Feil: Boten har ikke tillatelse til å opprette roller. Gi boten 'Administrer roller' tillatelse.", ephemeral=True)
@@ -287,40 +265,17 @@ class Setup(commands.Cog):
         
         # Store judge in database
         try:
-            conn = self.get_db_connection()
-            c = conn.cursor()
-            
             # Check if judge already exists
-            c.execute('''
-            SELECT * FROM judges WHERE user_id = ?
-            ''', (bruker.id,))
-            
-            existing_judge = c.fetchone()
+            existed = await repository.save_judge(bruker.id, judge_category.id, kategori_navn)
+            cache.judges.put(repository.Judge(bruker.id, judge_category.id, kategori_navn))
             
-            if existing_judge:
-                # Update existing judge
-                c.execute('''
-                UPDATE judges 
-                SET category_id = ?, category_name = ?
-                WHERE user_id = ?
-                ''', (judge_category.id, kategori_navn, bruker.id))
+            if existed:
                 logger.info(f"Updated judge {bruker.display_name} with new category")
             else:
-                # Insert new judge
-                c.execute('''
-                INSERT INTO judges (user_id, category_id, category_name)
-                VALUES (?, ?, ?)
-                ''', (bruker.id, judge_category.id, kategori_navn))
                 logger.info(f"Added new judge {bruker.display_name} to database")
             
             # Add category to categories table
-            c.execute('''
-            INSERT INTO categories (category_id, name, role_id)
-            VALUES (?, ?, ?)
-            ''', (judge_category.id, kategori_navn, judge_role.id))
-            
-            conn.commit()
-            conn.close()
+            await repository.add_category(judge_category.id, kategori_navn, judge_role.id)
             
             await interaction.followup.send(f"Dommer {bruker.mention} har fått tildelt kvarter '{kategori_navn}'.", ephemeral=True)
         except Exception as e:
@@ -337,22 +292,14 @@ class Setup(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Get judge info from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM judges WHERE user_id = ?
-        ''', (bruker.id,))
-        
-        judge = c.fetchone()
+        judge = await cache.judges.get(bruker.id)
         
         if not judge:
             await interaction.followup.send(f"{bruker.display_name} er ikke registrert som dommer.", ephemeral=True)
-            conn.close()
             return
             
         # Get category
-        category = interaction.guild.get_channel(judge['category_id'])
+        category = interaction.guild.get_channel(judge.category_id)
         
         # Delete category and all channels
         if category:
@@ -379,11 +326,11 @@ class Setup(commands.Cog):
                 logger.error(f"Error processing category deletion: {e}")
                 await interaction.followup.send(f"Advarsel: Feil ved prosessering av kategorisletting: {e}", ephemeral=True)
         else:
-            logger.warning(f"Judge category with ID {judge['category_id']} not found")
-            await interaction.followup.send(f"Advarsel: Fant ikke dommerkategorien med ID {judge['category_id']}.", ephemeral=True)
+            logger.warning(f"Judge category with ID {judge.category_id} not found")
+            await interaction.followup.send(f"Advarsel: Fant ikke dommerkategorien med ID {judge.category_id}.", ephemeral=True)
         
         # Remove judge role
-        judge_role = discord.utils.get(interaction.guild.roles, name="Dommer")
+        judge_role = await cache.guilds.role(interaction.guild, "judge_role_id", "Dommer")
         if judge_role and judge_role in bruker.roles:
             try:
                 await bruker.remove_roles(judge_role)
@@ -403,17 +350,11 @@ class Setup(commands.Cog):
         # Remove from database
         try:
             # Remove from judges table
-            c.execute('''
-            DELETE FROM judges WHERE user_id = ?
-            ''', (bruker.id,))
+            await repository.delete_judge(bruker.id)
+            cache.judges.remove(bruker.id)
             
             # Remove from categories table
-            c.execute('''
-            DELETE FROM categories WHERE category_id = ?
-            ''', (judge['category_id'],))
-            
-            conn.commit()
-            conn.close()
+            await repository.delete_category(judge.category_id)
             
             await interaction.followup.send(f"Dommer {bruker.mention} har blitt fjernet.", ephemeral=True)
             logger.info(f"Judge {bruker.name} (ID: {bruker.id}) removed")
@@ -436,16 +377,7 @@ class Setup(commands.Cog):
         category = await guild.create_category(navn)
         
         # Store in database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        INSERT INTO categories (category_id, name, role_id)
-        VALUES (?, ?, ?)
-        ''', (category.id, navn, 0))
-        
-        conn.commit()
-        conn.close()
+        await repository.add_category(category.id, navn, 0)
         
         await interaction.followup.send(f"Kategori '{navn}' er opprettet!")
         logger.info(f"Category '{navn}' created in guild {guild.name}")
@@ -468,16 +400,7 @@ class Setup(commands.Cog):
         await category.set_permissions(rolle, read_messages=True, send_messages=True)
         
         # Store in database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        INSERT INTO categories (category_id, name, role_id)
-        VALUES (?, ?, ?)
-        ''', (category.id, navn, rolle.id))
-        
-        conn.commit()
-        conn.close()
+        await repository.add_category(category.id, navn, rolle.id)
         
         await interaction.followup.send(f"Kategori '{navn}' er registrert med tilgang for rollen {rolle.name}!")
         logger.info(f"Category '{navn}' registered with role {rolle.name} in guild {guild.name}")
@@ -506,37 +429,10 @@ class Setup(commands.Cog):
         """
         await interaction.response.defer(ephemeral=True)
         
-        # Store in database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Check if permission already exists
-        c.execute('''
-        SELECT * FROM role_permissions WHERE function = ? AND guild_id = ?
-        ''', (rolle_funksjon, interaction.guild.id))
-        
-        existing_permission = c.fetchone()
-        
-        if existing_permission:
-            # Update existing permission
-            c.execute('''
-            UPDATE role_permissions
-            SET role_id = ?
-            WHERE function = ? AND guild_id = ?
-            ''', (rolle.id, rolle_funksjon, interaction.guild.id))
-            
-            action = "oppdatert"
-        else:
-            # Create new permission
-            c.execute('''
-            INSERT INTO role_permissions (guild_id, function, role_id)
-            VALUES (?, ?, ?)
-            ''', (interaction.guild.id, rolle_funksjon, rolle.id))
-            
-            action = "lagt til"
-        
-        conn.commit()
-        conn.close()
+        # Store in database, updating the permission if it already exists
+        existed = await repository.set_role_permission(interaction.guild.id, rolle_funksjon, rolle.id)
+        cache.permissions.invalidate(interaction.guild.id)
+        action = "oppdatert" if existed else "lagt til"
         
         # Get function name in Norwegian
         function_names = {
@@ -560,15 +456,7 @@ class Setup(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Get permissions from database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM role_permissions WHERE guild_id = ?
-        ''', (interaction.guild.id,))
-        
-        permissions = c.fetchall()
-        conn.close()
+        permissions = await repository.get_role_permissions(interaction.guild.id)
         
         if not permissions:
             await interaction.followup.send("Ingen rolletillatelser er satt opp ennå.")
@@ -592,9 +480,9 @@ class Setup(commands.Cog):
         }
         
         # Add each permission to the embed
-        for permission in permissions:
-            function_name = function_names.get(permission['function'], permission['function'])
-            role = interaction.guild.get_role(permission['role_id'])
+        for function, role_id in permissions.items():
+            function_name = function_names.get(function, function)
+            role = interaction.guild.get_role(role_id)
             role_name = role.name if role else "Ukjent rolle (slettet)"
             
             embed.add_field(
@@ -619,6 +507,7 @@ class Setup(commands.Cog):
         try:
             # Sync commands for the current guild
             synced = await self.bot.tree.sync(guild=discord.Object(id=interaction.guild.id))
+            embeds.tree_changed()
             
             # Log the sync
             logger.info(f"Commands synced for guild {interaction.guild.name} (ID: {interaction.guild.id})")
@@ -648,39 +537,14 @@ class Setup(commands.Cog):
         """
         await interaction.response.defer(ephemeral=True)
         
-        # Get connection to database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Check if "Arkiv" category already exists in database
-        c.execute('''
-        SELECT * FROM categories WHERE name = 'Arkiv'
-        ''')
-        
-        existing_archive = c.fetchone()
-        
-        if existing_archive:
-            # Update existing archive category
-            c.execute('''
-            UPDATE categories
-            SET category_id = ?
-            WHERE name = 'Arkiv'
-            ''', (kategori.id,))
-            
+        # Point the "Arkiv" category at this category, adding it if it doesn't exist
+        if await repository.set_named_category("Arkiv", kategori.id):
             logger.info(f"Updated archive category to {kategori.name} (ID: {kategori.id})")
             action = "oppdatert"
         else:
-            # Insert new archive category
-            c.execute('''
-            INSERT INTO categories (category_id, name, role_id)
-            VALUES (?, ?, ?)
-            ''', (kategori.id, "Arkiv", 0))
-            
             logger.info(f"Set new archive category: {kategori.name} (ID: {kategori.id})")
             action = "satt"
         
-        conn.commit()
-        
         # Set appropriate permissions for the archive category
         try:
             await kategori.set_permissions(interaction.guild.default_role, read_messages=False, send_messages=False)
@@ -696,14 +560,15 @@ class Setup(commands.Cog):
             await interaction.followup.send(f"Advarsel: Kunne ikke sette rettigheter for kategorien: {e}", ephemeral=True)
         
         # Check if archive-log channel exists in this category
-        archive_log_exists = False
-        for channel in kategori.text_channels:
-            if channel.name == "arkiv-logg":
-                archive_log_exists = True
-                break
+        archive_log = discord.utils.get(kategori.text_channels, name="arkiv-logg")
+        await cache.guilds.set(
+            interaction.guild.id,
+            archive_category_id=kategori.id,
+            archive_log_channel_id=archive_log.id if archive_log else None
+        )
         
         # Provide feedback to user
-        if archive_log_exists:
+        if archive_log:
             await interaction.followup.send(
                 f"Arkiv-kategori er {action} til '{kategori.name}'. "
                 f"Arkiv-logg kanal finnes allerede i denne kategorien.",
@@ -716,8 +581,6 @@ class Setup(commands.Cog):
                 f"Du kan opprette den med kommandoen `/sett-arkiv-logg`.",
                 ephemeral=True
             )
-        
-        conn.close()
     
     @app_commands.command(name="sett-arkiv-logg", description="Setter en eksisterende kanal som arkiv-logg")
     @app_commands.describe(
@@ -760,46 +623,20 @@ class Setup(commands.Cog):
         # Get the parent category
         category = kanal.category
         
-        # Get connection to database
-        conn = self.get_db_connection()
-        c = conn.cursor()
+        if category:
+            await cache.guilds.set(interaction.guild.id, archive_log_channel_id=kanal.id, archive_category_id=category.id)
+        else:
+            await cache.guilds.set(interaction.guild.id, archive_log_channel_id=kanal.id)
         
         # Check if the parent category is registered as "Arkiv"
         if category:
-            c.execute('''
-            SELECT * FROM categories WHERE category_id = ? AND name = 'Arkiv'
-            ''', (category.id,))
-            
-            archive_category = c.fetchone()
-            
-            if not archive_category:
+            if not await repository.is_named_category(category.id, "Arkiv"):
                 # Register the parent category as "Arkiv"
-                c.execute('''
-                SELECT * FROM categories WHERE name = 'Arkiv'
-                ''')
-                
-                existing_archive = c.fetchone()
-                
-                if existing_archive:
-                    # Update existing archive category
-                    c.execute('''
-                    UPDATE categories
-                    SET category_id = ?
-                    WHERE name = 'Arkiv'
-                    ''', (category.id,))
-                    
+                if await repository.set_named_category("Arkiv", category.id):
                     logger.info(f"Updated archive category to match the parent of archive-log: {category.name} (ID: {category.id})")
                 else:
-                    # Insert new archive category
-                    c.execute('''
-                    INSERT INTO categories (category_id, name, role_id)
-                    VALUES (?, ?, ?)
-                    ''', (category.id, "Arkiv", 0))
-                    
                     logger.info(f"Set new archive category to match the parent of archive-log: {category.name} (ID: {category.id})")
                 
-                conn.commit()
-                
                 await interaction.followup.send(
                     f"Arkiv-logg kanal er satt til '{kanal.name}'. "
                     f"Foreldrekategorien '{category.name}' er nå registrert som arkiv-kategori.",
@@ -817,8 +654,6 @@ class Setup(commands.Cog):
                 f"Merk: Kanalen er ikke i en kategori. Det anbefales å flytte den til arkiv-kategorien.",
                 ephemeral=True
             )
-        
-        conn.close()
     
     @app_commands.command(name="sett-saker-kategori", description="Setter en eksisterende kategori som saker-kategori")
     @app_commands.describe(
@@ -837,39 +672,14 @@ class Setup(commands.Cog):
         """
         await interaction.response.defer(ephemeral=True)
         
-        # Get connection to database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Check if "Saker" category already exists in database
-        c.execute('''
-        SELECT * FROM categories WHERE name = 'Saker'
-        ''')
-        
-        existing_cases = c.fetchone()
-        
-        if existing_cases:
-            # Update existing cases category
-            c.execute('''
-            UPDATE categories
-            SET category_id = ?
-            WHERE name = 'Saker'
-            ''', (kategori.id,))
-            
+        # Point the "Saker" category at this category, adding it if it doesn't exist
+        if await repository.set_named_category("Saker", kategori.id):
             logger.info(f"Updated cases category to {kategori.name} (ID: {kategori.id})")
             action = "oppdatert"
         else:
-            # Insert new cases category
-            c.execute('''
-            INSERT INTO categories (category_id, name, role_id)
-            VALUES (?, ?, ?)
-            ''', (kategori.id, "Saker", 0))
-            
             logger.info(f"Set new cases category: {kategori.name} (ID: {kategori.id})")
             action = "satt"
-        
-        conn.commit()
-        conn.close()
+        await cache.guilds.set(interaction.guild.id, cases_category_id=kategori.id)
         
         await interaction.followup.send(
             f"Saker-kategori er {action} til '{kategori.name}'.",
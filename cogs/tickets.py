@@ -1,13 +1,14 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import sqlite3
 import logging
-from typing import Optional
+from typing import List, Optional
 import datetime
-import os
-import tempfile
 import asyncio
+import repository
+import cache
+import embeds
+import transcript
 
 # Set up logging
 logger = logging.getLogger("CourtBot.Tickets")
@@ -31,23 +32,12 @@ class DeleteTicketView(discord.ui.View):
         is_judge = False
         
         # Check if user has the judge role
-        judge_role = discord.utils.get(interaction.guild.roles, name="Dommer")
+        judge_role = await cache.guilds.role(interaction.guild, "judge_role_id", "Dommer")
         if judge_role and judge_role in interaction.user.roles:
             is_judge = True
             
-        # Also check database for judge status
-        conn = sqlite3.connect('data/courtbot.db')
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM judges WHERE user_id = ?
-        ''', (interaction.user.id,))
-        
-        db_judge = c.fetchone()
-        conn.close()
-        
-        if db_judge:
+        # Also check the judge registry
+        if not is_judge and await cache.judges.is_judge(interaction.user.id):
             is_judge = True
         
         # Allow if user has manage_channels permission or is a judge
@@ -100,113 +90,66 @@ class Tickets(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        # Ticket buttons read during the startup warm-up, registered on ready
+        self.ticket_buttons: Optional[List[repository.TicketButton]] = None
+        self.views_registered = False
         # Register persistent views when the cog is loaded
         self.bot.add_view(DeleteTicketView(bot))
         
-        # Load existing ticket buttons from database
-        self.load_ticket_views()
+    async def cog_load(self):
+        """Called by discord.py when the cog is loaded"""
+        # Drop case reservations left behind by a crash during ticket creation
+        await repository.clear_stale_reservations()
         
-        # Ensure ticket_buttons table exists
-        self.ensure_ticket_buttons_table()
+    async def fetch_ticket_buttons(self):
+        """Read the ticket buttons from the database, run during the startup warm-up"""
+        self.ticket_buttons = await repository.get_ticket_buttons()
+        
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Register the ticket views once the guild's channels are known"""
+        if self.views_registered:
+            return
+        self.views_registered = True
+        await self.load_ticket_views()
         
-    def load_ticket_views(self):
+    async def load_ticket_views(self):
         """Load existing ticket buttons from database"""
         try:
-            conn = self.get_db_connection()
-            c = conn.cursor()
-            
-            # Check if categories table exists
-            c.execute('''
-            SELECT name FROM sqlite_master WHERE type='table' AND name='categories'
-            ''')
-            
-            if not c.fetchone():
-                logger.warning("Categories table doesn't exist yet. Skipping ticket view loading.")
-                conn.close()
-                return
-            
-            # Get all categories
-            c.execute('''
-            SELECT * FROM categories
-            ''')
-            
-            categories = c.fetchall()
-            
-            # Load ticket views for each category
-            for category in categories:
-                # Check if ticket_buttons table exists
-                c.execute('''
-                SELECT name FROM sqlite_master WHERE type='table' AND name='ticket_buttons'
-                ''')
-                
-                if not c.fetchone():
-                    logger.warning("Ticket_buttons table doesn't exist yet. Skipping ticket view loading.")
-                    break
-                
-                # Get ticket buttons for this category
-                c.execute('''
-                SELECT * FROM ticket_buttons WHERE category_id = ?
-                ''', (category['category_id'],))
+            # Get ticket buttons whose category is registered
+            if self.ticket_buttons is None:
+                await self.fetch_ticket_buttons()
+            buttons = self.ticket_buttons
+            
+            # Register views for each button
+            for button in buttons:
+                # Check if the category still exists on the server
+                category_channel = self.bot.get_channel(button.category_id)
+                if not category_channel:
+                    logger.warning(f"Category {button.category_id} not found. Skipping button.")
+                    continue
                 
-                buttons = c.fetchall()
-                
-                # Register views for each button
-                for button in buttons:
-                    # Check if the category still exists on the server
-                    category_channel = self.bot.get_channel(button['category_id'])
-                    if not category_channel:
-                        logger.warning(f"Category {button['category_id']} not found. Skipping button.")
-                        continue
-                    
-                    # Create and register the view
-                    view = TicketView(
-                        self.bot,
-                        button['category_id'],
-                        button['title'],
-                        button['description'],
-                        button['emoji'],
-                        button['button_text'],
-                        button['role_id']
-                    )
-                    self.bot.add_view(view)
-                    logger.info(f"Registered ticket view for {button['title']} in category {category['name']}")
-            
-            conn.close()
+                # Create and register the view
+                view = TicketView(
+                    self.bot,
+                    button.category_id,
+                    button.title,
+                    button.description,
+                    button.emoji,
+                    button.button_text,
+                    button.role_id
+                )
+                self.bot.add_view(view)
+                logger.info(f"Registered ticket view for {button.title} in category {category_channel.name}")
+            
         except Exception as e:
             logger.error(f"Error loading ticket views: {e}")
             # Continue bot operation even if ticket views couldn't be loaded
         
-    def ensure_ticket_buttons_table(self):
-        """Ensure the ticket_buttons table exists in the database"""
-        try:
-            conn = self.get_db_connection()
-            c = conn.cursor()
-            
-            # Create ticket_buttons table if it doesn't exist
-            c.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_buttons (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category_id INTEGER,
-                title TEXT,
-                description TEXT,
-                emoji TEXT,
-                button_text TEXT,
-                role_id INTEGER,
-                FOREIGN KEY (category_id) REFERENCES categories (category_id)
-            )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Ensured ticket_buttons table exists")
-        except Exception as e:
-            logger.error(f"Error ensuring ticket_buttons table: {e}")
-        
-    def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect('data/courtbot.db')
-        conn.row_factory = sqlite3.Row
-        return conn
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        """Forget the cached case of a deleted channel"""
+        cache.cases.invalidate(channel.id)
         
     @commands.Cog.listener()
     async def on_interaction(self, interaction: discord.Interaction):
@@ -225,35 +168,18 @@ class Tickets(commands.Cog):
         # Extract category ID from custom_id
         category_id = int(custom_id.replace('ticket_button_', ''))
         
-        # Get connection to database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Get next case ID
-        c.execute("SELECT MAX(id) as max_id FROM cases")
-        result = c.fetchone()
-        next_id = 1 if result['max_id'] is None else result['max_id'] + 1
-        
         # Get category
         category = interaction.guild.get_channel(category_id)
         if not category:
             await interaction.response.send_message("Feil: Kategorien eksisterer ikke lenger.", ephemeral=True)
-            conn.close()
             return
         
         # Get category info from database
-        c.execute('''
-        SELECT * FROM categories WHERE category_id = ?
-        ''', (category_id,))
+        category_info = await repository.get_category(category_id)
         
-        category_info = c.fetchone()
         if not category_info:
             await interaction.response.send_message("Feil: Kategorien er ikke registrert i databasen.", ephemeral=True)
-            conn.close()
             return
-            
-        # Create ticket channel with proper naming format using user's display name
-        channel_name = f"{interaction.user.display_name.lower().replace(' ', '-')}-{next_id}"
         
         # Set permissions for channel
         overwrites = {
@@ -262,56 +188,89 @@ class Tickets(commands.Cog):
         }
         
         # Add role permission if specified
-        if category_info['role_id'] and category_info['role_id'] != 0:
-            role = interaction.guild.get_role(category_info['role_id'])
+        if category_info.role_id and category_info.role_id != 0:
+            role = interaction.guild.get_role(category_info.role_id)
             if role:
                 overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
         
         # Create channel
+        next_id = None
+        channel = None
+        opened = False
         try:
             await interaction.response.defer(ephemeral=True)
             
+            # Reserve the case row up front so the case ID is allocated atomically
+            next_id = await repository.reserve_case(
+                category.id, interaction.user.id, f"Ny sak i {category.name}", f"Opprettet av {interaction.user.display_name}"
+            )
+            
+            # Create ticket channel with proper naming format using user's display name
+            channel_name = f"{interaction.user.display_name.lower().replace(' ', '-')}-{next_id}"
+            
             channel = await category.create_text_channel(
                 name=channel_name,
                 overwrites=overwrites
             )
             
             # Create welcome message
-            embed = discord.Embed(
-                title=f"Ny sak i {category.name}",
-                description="Velkommen til din nye sak. En dommer vil se på saken din så snart som mulig.",
-                color=discord.Color.blue()
+            embed = embeds.render(
+                "case_opened",
+                category=category.name,
+                case_id=next_id,
+                creator=interaction.user.mention,
+                created=discord.utils.format_dt(datetime.datetime.now())
             )
-            embed.add_field(name="Sak ID", value=str(next_id), inline=True)
-            embed.add_field(name="Opprettet av", value=interaction.user.mention, inline=True)
-            embed.add_field(name="Status", value="🟢 Åpen", inline=True)
-            embed.add_field(name="Opprettet", value=discord.utils.format_dt(datetime.datetime.now()), inline=True)
-            embed.set_footer(text=f"Sak #{next_id}")
             
             # Send welcome message
-            await channel.send(
+            welcome = await channel.send(
                 f"{interaction.user.mention} har opprettet en ny sak.",
                 embed=embed
             )
             
-            # Store case in database
-            c.execute('''
-            INSERT INTO cases (channel_id, category_id, creator_id, title, description)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (channel.id, category.id, interaction.user.id, f"Ny sak i {category.name}", f"Opprettet av {interaction.user.display_name}"))
-            
-            conn.commit()
+            # Attach the channel to the reserved case and open it
+            await cache.cases.open_reserved(next_id, channel.id)
+            opened = True
             
             # Send confirmation to user
             await interaction.followup.send(f"Din sak har blitt opprettet i {channel.mention}!", ephemeral=True)
             logger.info(f"Ticket created by {interaction.user} in category {category.name}")
             
+            # Capture the channel from its first message. The case is open
+            # either way, and catch-up stores the history if this fails
+            capture_cog = self.bot.get_cog("Capture")
+            if capture_cog:
+                try:
+                    await capture_cog.start_channel(channel.id, [welcome])
+                except Exception as e:
+                    logger.error(f"Error starting capture of channel {channel.id}: {e}")
+            
+        except LookupError as e:
+            # The reservation was cleared before the channel was attached
+            await interaction.followup.send("Feil: Reservasjonen av saken gikk tapt. Vennligst prøv igjen.", ephemeral=True)
+            logger.error(f"Error creating ticket: {e}")
+            await self._delete_orphan_channel(channel)
+            
         except Exception as e:
-            await interaction.followup.send(f"Feil under oppretting av sak: {e}", ephemeral=True)
             logger.error(f"Error creating ticket: {e}")
+            if opened:
+                # Only the confirmation failed, the case exists
+                return
             
-        finally:
-            conn.close()
+            # Release the reservation and delete the channel, the case never got it
+            if next_id is not None:
+                await repository.release_reservation(next_id)
+            await self._delete_orphan_channel(channel)
+            await interaction.followup.send(f"Feil under oppretting av sak: {e}", ephemeral=True)
+    
+    async def _delete_orphan_channel(self, channel: Optional[discord.TextChannel]):
+        """Delete a ticket channel that has no case"""
+        if channel is None:
+            return
+        try:
+            await channel.delete(reason="Saken kunne ikke opprettes")
+        except discord.HTTPException as e:
+            logger.error(f"Error deleting channel {channel.id} without a case: {e}")
 
     @app_commands.command(name="ticket", description="Oppretter en ticket-knapp i kanalen")
     @app_commands.describe(
@@ -335,58 +294,17 @@ class Tickets(commands.Cog):
         """Creates a ticket button in the channel it was typed in"""
         await interaction.response.defer(ephemeral=True)
         
-        # Get connection to database
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        # Store category in database if not exists
-        c.execute('''
-        SELECT * FROM categories WHERE category_id = ?
-        ''', (category.id,))
-        
-        existing = c.fetchone()
         role_id = role.id if role else 0
         
-        if existing:
-            # Update existing category
-            c.execute('''
-            UPDATE categories
-            SET name = ?, role_id = ?
-            WHERE category_id = ?
-            ''', (title, role_id, category.id))
-        else:
-            # Insert new category
-            c.execute('''
-            INSERT INTO categories (category_id, name, role_id)
-            VALUES (?, ?, ?)
-            ''', (category.id, title, role_id))
+        # Store category in database, updating it if it already exists
+        await repository.save_category(category.id, title, role_id)
         
         # Store button information in the ticket_buttons table
-        c.execute('''
-        SELECT * FROM ticket_buttons WHERE category_id = ?
-        ''', (category.id,))
-        
-        existing_button = c.fetchone()
-        
-        if existing_button:
-            # Update existing button
-            c.execute('''
-            UPDATE ticket_buttons
-            SET title = ?, description = ?, emoji = ?, button_text = ?, role_id = ?
-            WHERE category_id = ?
-            ''', (title, description, button_emoji, button_text, role_id, category.id))
+        if await repository.save_ticket_button(category.id, title, description, button_emoji, button_text, role_id):
             logger.info(f"Updated ticket button for category {category.id}")
         else:
-            # Insert new button
-            c.execute('''
-            INSERT INTO ticket_buttons (category_id, title, description, emoji, button_text, role_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (category.id, title, description, button_emoji, button_text, role_id))
             logger.info(f"Inserted new ticket button for category {category.id}")
         
-        conn.commit()
-        conn.close()
-        
         # Create embed for ticket panel
         embed = discord.Embed(
             title=title,
@@ -422,47 +340,25 @@ class Tickets(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Check if channel is a ticket
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM cases WHERE channel_id = ?
-        ''', (interaction.channel.id,))
-        
-        case = c.fetchone()
+        case = await cache.cases.get_by_channel(interaction.channel.id)
         
         if not case:
             await interaction.followup.send("Dette er ikke en sak-kanal.")
-            conn.close()
             return
         
         # Get archive category
-        c.execute('''
-        SELECT * FROM categories WHERE name = 'Arkiv'
-        ''')
-        
-        archive = c.fetchone()
-        
-        if not archive:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.")
-            conn.close()
-            return
-        
-        archive_category = interaction.guild.get_channel(archive['category_id'])
+        archive_category = await cache.guilds.archive_category(interaction.guild)
         
         if not archive_category:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke lenger.")
-            conn.close()
+            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.")
             return
         
         # Update case status
-        c.execute('''
-        UPDATE cases
-        SET status = 'Lukket', closed_at = ?
-        WHERE channel_id = ?
-        ''', (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), interaction.channel.id))
-        
-        conn.commit()
+        try:
+            await cache.cases.close(case)
+        except LookupError:
+            await interaction.followup.send("Denne saken er arkivert og kan ikke endres.")
+            return
         
         # Archive channel (move to archive category)
         await interaction.channel.edit(category=archive_category)
@@ -474,19 +370,16 @@ class Tickets(commands.Cog):
         await interaction.channel.set_permissions(interaction.guild.default_role, send_messages=False)
         
         # Send closure message
-        embed = discord.Embed(
-            title="Sak lukket",
-            description=f"Denne saken har blitt lukket av {interaction.user.mention}.",
-            color=discord.Color.red()
+        embed = embeds.render(
+            "case_closed",
+            closed_by=interaction.user.mention,
+            closed=discord.utils.format_dt(datetime.datetime.now())
         )
-        embed.add_field(name="Lukket", value=discord.utils.format_dt(datetime.datetime.now()), inline=True)
         
         await interaction.channel.send(embed=embed)
         
         await interaction.followup.send("Saken er nå lukket og arkivert.")
-        logger.info(f"Case {case['id']} closed by {interaction.user}")
-        
-        conn.close()
+        logger.info(f"Case {case.id} closed by {interaction.user}")
     
     @app_commands.command(name="arkiver-sak", description="Arkiverer den nåværende saken uten å lukke den")
     @app_commands.default_permissions(administrator=True)
@@ -495,37 +388,17 @@ class Tickets(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Check if channel is a ticket
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM cases WHERE channel_id = ?
-        ''', (interaction.channel.id,))
-        
-        case = c.fetchone()
+        case = await cache.cases.get_by_channel(interaction.channel.id)
         
         if not case:
             await interaction.followup.send("Dette er ikke en sak-kanal.")
-            conn.close()
             return
         
         # Get archive category
-        c.execute('''
-        SELECT * FROM categories WHERE name = 'Arkiv'
-        ''')
-        
-        archive = c.fetchone()
-        
-        if not archive:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.")
-            conn.close()
-            return
-        
-        archive_category = interaction.guild.get_channel(archive['category_id'])
+        archive_category = await cache.guilds.archive_category(interaction.guild)
         
         if not archive_category:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke lenger.")
-            conn.close()
+            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.")
             return
         
         # Archive channel (move to archive category)
@@ -545,9 +418,7 @@ class Tickets(commands.Cog):
         await interaction.channel.send(embed=embed)
         
         await interaction.followup.send("Saken er nå arkivert.")
-        logger.info(f"Case {case['id']} archived by {interaction.user}")
-        
-        conn.close()
+        logger.info(f"Case {case.id} archived by {interaction.user}")
 
     @app_commands.command(name="avslutt-sak", description="Avslutter saken med begrunnelse og arkiverer den")
     @app_commands.describe(
@@ -561,58 +432,32 @@ class Tickets(commands.Cog):
         await interaction.response.defer(ephemeral=False)
         
         # Check if channel is a ticket
-        conn = self.get_db_connection()
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT * FROM cases WHERE channel_id = ?
-        ''', (interaction.channel.id,))
-        
-        case = c.fetchone()
+        case = await cache.cases.get_by_channel(interaction.channel.id)
         
         if not case:
             await interaction.followup.send("Dette er ikke en sak-kanal.", ephemeral=True)
-            conn.close()
             return
         
         # Check if user is a judge or admin
-        judge_role = discord.utils.get(interaction.guild.roles, name="Dommer")
-        admin_role = discord.utils.get(interaction.guild.roles, name="Administrator")
+        judge_role = await cache.guilds.role(interaction.guild, "judge_role_id", "Dommer")
+        admin_role = await cache.guilds.role(interaction.guild, "admin_role_id", "Administrator")
         
         if not (judge_role in interaction.user.roles or admin_role in interaction.user.roles):
             await interaction.followup.send("Du har ikke tillatelse til å avslutte saker.", ephemeral=True)
-            conn.close()
             return
         
         # Get archive category
-        c.execute('''
-        SELECT * FROM categories WHERE name = 'Arkiv'
-        ''')
-        
-        archive = c.fetchone()
-        
-        if not archive:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.", ephemeral=True)
-            conn.close()
-            return
-        
-        archive_category = interaction.guild.get_channel(archive['category_id'])
+        archive_category = await cache.guilds.archive_category(interaction.guild)
         
         if not archive_category:
-            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke lenger.", ephemeral=True)
-            conn.close()
+            await interaction.followup.send("Feil: Arkiv-kategori finnes ikke.", ephemeral=True)
             return
         
         # Get archive channel
-        archive_channel = None
-        for channel in archive_category.text_channels:
-            if channel.name == "arkiv-logg":
-                archive_channel = channel
-                break
+        archive_channel = await cache.guilds.archive_log(interaction.guild)
         
         if not archive_channel:
             await interaction.followup.send("Feil: Arkiv-logg kanal finnes ikke.", ephemeral=True)
-            conn.close()
             return
         
         # Step 1: Export to HTML
@@ -620,49 +465,45 @@ class Tickets(commands.Cog):
         evidence_cog = self.bot.get_cog("Evidence")
         if not evidence_cog:
             await interaction.followup.send("Feil: Kunne ikke finne Evidence-cog for eksport.", ephemeral=True)
-            conn.close()
             return
         
         # Create a temporary message to show progress
         progress_msg = await interaction.followup.send("Avslutter sak...\n- Eksporterer til HTML...")
         
-        # Call the export_case method to generate HTML
+        async def report_progress(count: int):
+            await progress_msg.edit(content=f"Avslutter sak...\n- Eksporterer til HTML... {count} meldinger")
+        
+        # Export the whole channel, resuming an export an earlier attempt left unfinished
         try:
-            html_content = await evidence_cog.generate_case_html(interaction.channel, case)
-            if not html_content:
-                await progress_msg.edit(content="Feil: Kunne ikke generere HTML for saken.")
-                conn.close()
+            exported = await evidence_cog.export_case_html(interaction.channel, case, "close", report_progress)
+            if not exported:
+                await progress_msg.edit(content="Feil: Kunne ikke generere HTML for saken. Kjør kommandoen igjen for å fortsette eksporten.")
                 return
+            file_path, message_count = exported
             
-            await progress_msg.edit(content="Avslutter sak...\n- Eksporterer til HTML... ✅\n- Lagrer i arkiv...")
+            await progress_msg.edit(content=f"Avslutter sak...\n- Eksporterer til HTML... ✅ ({message_count} meldinger)\n- Lagrer i arkiv...")
         except Exception as e:
             await progress_msg.edit(content=f"Feil under HTML-generering: {e}")
-            logger.error(f"Error generating HTML for case {case['id']}: {e}")
-            conn.close()
+            logger.error(f"Error generating HTML for case {case.id}: {e}")
             return
         
         # Step 2: Save and upload to audit log
         try:
             # Create file name for display
-            display_filename = f"sak_{case['id']}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(html_content)
-                temp_file_path = temp_file.name
+            display_filename = f"sak_{case.id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
             
             # Create Discord file object
-            file = discord.File(temp_file_path, filename=display_filename)
+            file = discord.File(file_path, filename=display_filename)
             
             # Send to archive channel
             archive_message = await archive_channel.send(
-                f"**Sak #{case['id']} - {case['title']}** avsluttet av {interaction.user.mention}\n"
+                f"**Sak #{case.id} - {case.title}** avsluttet av {interaction.user.mention}\n"
                 f"**Begrunnelse:** {grunnlag}",
                 file=file
             )
             
-            # Clean up temporary file
-            os.unlink(temp_file_path)
+            # Remove the export and its resume cursor
+            await transcript.discard(interaction.channel.id, "close")
             
             # Get the URL of the uploaded file
             archive_url = None
@@ -673,58 +514,49 @@ class Tickets(commands.Cog):
             
             if not archive_url:
                 await progress_msg.edit(content="Feil: Kunne ikke finne URL for arkivert fil.")
-                conn.close()
                 return
             
-            await progress_msg.edit(content="Avslutter sak...\n- Eksporterer til HTML... ✅\n- Lagrer i arkiv... ✅\n- Sender varsel til klient...")
+            await progress_msg.edit(content=f"Avslutter sak...\n- Eksporterer til HTML... ✅ ({message_count} meldinger)\n- Lagrer i arkiv... ✅\n- Sender varsel til klient...")
         except Exception as e:
             await progress_msg.edit(content=f"Feil under arkivering: {e}")
-            logger.error(f"Error archiving case {case['id']}: {e}")
-            conn.close()
+            logger.error(f"Error archiving case {case.id}: {e}")
             return
         
         # Step 3: Notify case creator
         try:
-            creator = interaction.guild.get_member(case['creator_id'])
+            creator = interaction.guild.get_member(case.creator_id)
             if creator:
-                embed = discord.Embed(
-                    title=f"Din sak har blitt avsluttet",
-                    description=f"Sak #{case['id']} - {case['title']} har blitt avsluttet av {interaction.user.display_name}.",
-                    color=discord.Color.red()
+                embed = embeds.render(
+                    "case_concluded_dm",
+                    case_id=case.id,
+                    title=case.title,
+                    closed_by=interaction.user.display_name,
+                    reason=grunnlag,
+                    archive_url=archive_url
                 )
-                embed.add_field(name="Begrunnelse", value=grunnlag, inline=False)
-                embed.add_field(name="Arkiv", value=f"[Klikk her for å se arkivert sak]({archive_url})", inline=False)
                 
                 try:
                     await creator.send(embed=embed)
                 except discord.Forbidden:
                     logger.warning(f"Could not send DM to case creator {creator.name}")
             
-            await progress_msg.edit(content="Avslutter sak...\n- Eksporterer til HTML... ✅\n- Lagrer i arkiv... ✅\n- Sender varsel til klient... ✅\n- Oppdaterer database...")
+            await progress_msg.edit(content=f"Avslutter sak...\n- Eksporterer til HTML... ✅ ({message_count} meldinger)\n- Lagrer i arkiv... ✅\n- Sender varsel til klient... ✅\n- Oppdaterer database...")
         except Exception as e:
             await progress_msg.edit(content=f"Feil under varsling av klient: {e}")
-            logger.error(f"Error notifying creator for case {case['id']}: {e}")
+            logger.error(f"Error notifying creator for case {case.id}: {e}")
             # Continue anyway, this is not critical
         
         # Step 4: Update case in database
         try:
-            c.execute('''
-            UPDATE cases
-            SET status = 'Lukket', closed_at = ?, closing_reason = ?, archive_url = ?
-            WHERE channel_id = ?
-            ''', (
-                datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 
-                grunnlag, 
-                archive_url, 
-                interaction.channel.id
-            ))
-            
-            conn.commit()
-            await progress_msg.edit(content="Avslutter sak...\n- Eksporterer til HTML... ✅\n- Lagrer i arkiv... ✅\n- Sender varsel til klient... ✅\n- Oppdaterer database... ✅\n- Lukker kanal...")
+            await cache.cases.close(case, grunnlag, archive_url)
+            
+            await progress_msg.edit(content=f"Avslutter sak...\n- Eksporterer til HTML... ✅ ({message_count} meldinger)\n- Lagrer i arkiv... ✅\n- Sender varsel til klient... ✅\n- Oppdaterer database... ✅\n- Lukker kanal...")
+        except LookupError:
+            await progress_msg.edit(content="Denne saken er arkivert og kan ikke endres.")
+            return
         except Exception as e:
             await progress_msg.edit(content=f"Feil under oppdatering av database: {e}")
-            logger.error(f"Error updating database for case {case['id']}: {e}")
-            conn.close()
+            logger.error(f"Error updating database for case {case.id}: {e}")
             return
         
         # Step 5: Close the ticket (move to archive and disable sending)
@@ -739,27 +571,24 @@ class Tickets(commands.Cog):
             await interaction.channel.set_permissions(interaction.guild.default_role, send_messages=False)
             
             # Send closure message
-            embed = discord.Embed(
-                title="Sak avsluttet",
-                description=f"Denne saken har blitt avsluttet av {interaction.user.mention}.",
-                color=discord.Color.red()
+            embed = embeds.render(
+                "case_concluded",
+                closed_by=interaction.user.mention,
+                reason=grunnlag,
+                closed=discord.utils.format_dt(datetime.datetime.now()),
+                archive_url=archive_url
             )
-            embed.add_field(name="Begrunnelse", value=grunnlag, inline=False)
-            embed.add_field(name="Lukket", value=discord.utils.format_dt(datetime.datetime.now()), inline=True)
-            embed.add_field(name="Arkiv", value=f"[Klikk her for å se arkivert sak]({archive_url})", inline=False)
             
             # Create delete view
             delete_view = DeleteTicketView(self.bot)
             
             await interaction.channel.send(embed=embed, view=delete_view)
             
-            await progress_msg.edit(content=f"Sak #{case['id']} er nå avsluttet og arkivert.")
-            logger.info(f"Case {case['id']} closed with reason '{grunnlag}' by {interaction.user}")
+            await progress_msg.edit(content=f"Sak #{case.id} er nå avsluttet og arkivert.")
+            logger.info(f"Case {case.id} closed with reason '{grunnlag}' by {interaction.user}")
         except Exception as e:
             await progress_msg.edit(content=f"Feil under lukking av kanal: {e}")
-            logger.error(f"Error closing channel for case {case['id']}: {e}")
-        
-        conn.close()
+            logger.error(f"Error closing channel for case {case.id}: {e}")
 
 async def setup(bot):
     await bot.add_cog(Tickets(bot))
@@ -14,6 +14,46 @@ GUILD_ID = 123456789012345678
 # Owner ID (replace with your actual Discord user ID)
 OWNER_ID = 123456789012345678  
 
+# Database settings
+DATABASE = {
+    "backend": "sqlite",         # "sqlite" for the file below, "memory" for tests and benchmarks
+    "path": "data/courtbot.db",
+    "pool_size": 4,              # Connections kept open for the life of the process
+    "snapshot_pool_size": 2,     # Read-only connections for reports and listings
+    "journal_mode": "WAL",       # Readers never block behind a writer
+    "synchronous": "NORMAL",     # Safe with WAL, avoids an fsync on every commit
+    "cache_size": -16000,        # Page cache per connection (negative = KiB)
+    "mmap_size": 268435456,      # Memory-map up to 256 MiB of the database file
+    "busy_timeout": 5000,        # Milliseconds to wait on a locked database
+    "write_batch_size": 64       # Most writes committed together by the writer
+}
+
+# In-memory caches
+CACHE = {
+    "permission_ttl": 300,       # Seconds before cached role permissions are reloaded
+    "case_cache_size": 1024,     # Channels whose case is kept in memory
+    "member_ttl": 600,           # Seconds before a member's cached name and avatar are refreshed
+    "embed_cache_size": 256,     # Rendered case and evidence embeds kept in memory
+    "embed_ttl": 300,            # Seconds a rendered embed is served before it is rebuilt
+    "invalidation_poll_seconds": 2,          # How often changes made by other processes are picked up
+    "invalidation_retention_minutes": 60     # How long the invalidation log is kept
+}
+
+# Archival of closed cases
+ARCHIVAL = {
+    "after_days": 30,            # Days a case stays closed before it moves to the archive tables
+    "interval_minutes": 60,      # How often the archival job runs
+    "batch_size": 500            # Cases moved per transaction
+}
+
+# Transcript exports of case channels
+TRANSCRIPTS = {
+    "directory": "data/exports",     # Where exports are written until they are uploaded
+    "checkpoint_messages": 500,      # Messages written between saves of the resume cursor
+    "progress_seconds": 5,           # How often progress is reported while exporting
+    "live_capture": False            # Keep a local copy of case channel messages, so exports need no API calls
+}
+
 # Bot Colors
 COLORS = {
     "primary": 0x3498db,  # Blue
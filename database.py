@@ -0,0 +1,289 @@
+import sqlite3
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from config import DATABASE
+import storage
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Database")
+
+# Where the data lives, chosen by config.DATABASE["backend"]
+backend: storage.StorageBackend = storage.create_backend()
+
+def get_db_connection() -> sqlite3.Connection:
+    """Open a new read-write connection on the current backend"""
+    return backend.connect()
+
+def get_snapshot_connection() -> sqlite3.Connection:
+    """Open a new read-only connection on the current backend"""
+    return backend.connect_snapshot()
+
+class ConnectionPool:
+    """A fixed-size pool of long-lived SQLite connections"""
+
+    def __init__(self, size: int, connect: Callable[[], sqlite3.Connection] = get_db_connection):
+        self.size = size
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, opening a new one while below the pool size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool"""
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+_pool = ConnectionPool(DATABASE["pool_size"])
+
+# Every SQLite call runs on an executor so the discord.py event loop never
+# waits on disk I/O. Reads use the pool, one worker per pooled connection so
+# a worker never has to wait for a connection to be released.
+_executor = ThreadPoolExecutor(max_workers=DATABASE["pool_size"], thread_name_prefix="courtbot-db")
+
+# Reports read from their own read-only connections on their own workers, so
+# a long aggregate never holds up the reads and writes that commands make
+_snapshot_pool = ConnectionPool(DATABASE["snapshot_pool_size"], get_snapshot_connection)
+_snapshot_executor = ThreadPoolExecutor(max_workers=DATABASE["snapshot_pool_size"], thread_name_prefix="courtbot-db-report")
+
+# All writes go through a single writer thread with its own connection, so
+# two writers never compete for the database lock
+_writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="courtbot-db-writer")
+_writer_conn: Optional[sqlite3.Connection] = None
+_write_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
+def _run_sync(func: Callable[..., Any], *args) -> Any:
+    """Run func with a pooled connection"""
+    conn = _pool.acquire()
+    try:
+        result = func(conn, *args)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _pool.release(conn)
+
+def _snapshot_sync(func: Callable[..., Any], *args) -> Any:
+    """Run func inside a read transaction on a snapshot connection"""
+    conn = _snapshot_pool.acquire()
+    try:
+        conn.execute("BEGIN")
+        try:
+            return func(conn, *args)
+        finally:
+            conn.execute("ROLLBACK")
+    finally:
+        _snapshot_pool.release(conn)
+
+def _commit_batch(batch: List[Tuple[Callable[..., Any], tuple]]) -> List[Tuple[Any, Optional[Exception]]]:
+    """
+    Run a batch of writes in one transaction on the writer connection
+
+    Each write runs inside its own savepoint, so a write that raises is rolled
+    back on its own without affecting the rest of the batch.
+
+    Returns:
+        list: A (result, exception) pair for every write in the batch
+    """
+    global _writer_conn
+    if _writer_conn is None:
+        _writer_conn = get_db_connection()
+    conn = _writer_conn
+
+    results = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for func, args in batch:
+            conn.execute("SAVEPOINT write")
+            try:
+                result = func(conn, *args)
+            except Exception as e:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                results.append((None, e))
+            else:
+                conn.execute("RELEASE write")
+                results.append((result, None))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+async def _writer_loop():
+    """Take pending writes off the queue and commit them in batches"""
+    loop = asyncio.get_running_loop()
+    while True:
+        # Wait for a write, then take everything else that queued up meanwhile
+        batch = [await _write_queue.get()]
+        while len(batch) < DATABASE["write_batch_size"]:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        try:
+            results = await loop.run_in_executor(
+                _writer_executor, _commit_batch, [(func, args) for func, args, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Failed to commit batch of {len(batch)} writes: {e}")
+            results = [(None, e)] * len(batch)
+
+        for (_, _, future), (result, error) in zip(batch, results):
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            _write_queue.task_done()
+
+        logger.debug(f"Committed batch of {len(batch)} writes")
+
+async def run(func: Callable[..., Any], *args) -> Any:
+    """
+    Run a blocking read function off the event loop
+
+    The function is called as func(conn, *args) on a pooled connection. Use
+    write() for anything that modifies the database.
+
+    Args:
+        func: The function to run, taking a connection as first argument
+        args: Extra arguments passed on to func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _run_sync, func, *args)
+
+async def snapshot(func: Callable[..., Any], *args) -> Any:
+    """
+    Run a read-only reporting function against a consistent snapshot
+
+    The function is called as func(conn, *args) on a read-only connection
+    inside a single read transaction, so every query it makes sees the
+    database as it was when the first one ran. With WAL, this never waits on
+    the writer and the writer never waits on it.
+
+    Args:
+        func: The function to run, taking a connection as first argument
+        args: Extra arguments passed on to func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_snapshot_executor, _snapshot_sync, func, *args)
+
+async def write(func: Callable[..., Any], *args) -> Any:
+    """
+    Queue a write for the single writer and wait until it is committed
+
+    The function is called as func(conn, *args) on the writer connection.
+    Writes that are queued while a batch is being committed are grouped into
+    the next batch and share one commit. If func raises, only its own
+    changes are rolled back and the exception is raised here.
+
+    Args:
+        func: The function to run, taking a connection as first argument
+        args: Extra arguments passed on to func
+
+    Returns:
+        Whatever func returns, once the batch it ran in has been committed
+    """
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.create_task(_writer_loop())
+
+    future = asyncio.get_running_loop().create_future()
+    _write_queue.put_nowait((func, args, future))
+    return await future
+
+async def fetchone(query: str, params: Sequence[Any] = ()) -> Optional[Tuple]:
+    """Run a query and return the first row, or None"""
+    return await run(lambda conn: conn.execute(query, params).fetchone())
+
+async def fetchall(query: str, params: Sequence[Any] = ()) -> List[Tuple]:
+    """Run a query and return all rows"""
+    return await run(lambda conn: conn.execute(query, params).fetchall())
+
+async def execute(query: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+    """
+    Run a single statement through the writer
+
+    Returns:
+        sqlite3.Cursor: The cursor, for reading lastrowid and rowcount
+    """
+    return await write(lambda conn: conn.execute(query, params))
+
+async def executemany(query: str, params: Sequence[Sequence[Any]]) -> sqlite3.Cursor:
+    """Run a statement once per parameter set through the writer, in one commit"""
+    return await write(lambda conn: conn.executemany(query, params))
+
+async def use_backend(new_backend: storage.StorageBackend):
+    """
+    Switch to another storage backend, e.g. an in-memory one for a benchmark
+
+    Pending writes are committed and every open connection on the old
+    backend is closed first.
+
+    Args:
+        new_backend: The backend to use for all connections from now on
+    """
+    global backend
+    await close()
+    backend = new_backend
+    logger.info(f"Using {backend.name} storage backend")
+
+async def close():
+    """Commit pending writes and close all connections, used on shutdown"""
+    global _writer_conn, _writer_task
+    if _writer_task is not None:
+        await _write_queue.join()
+        _writer_task.cancel()
+        _writer_task = None
+
+    if _writer_conn is not None:
+        _writer_conn.close()
+        _writer_conn = None
+
+    _pool.close()
+    _snapshot_pool.close()
+    backend.close()
+    logger.info("Database connections closed")
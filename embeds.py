@@ -0,0 +1,196 @@
+"""
+Prebuilt embeds
+
+Embeds whose layout never changes are built once and kept as dicts. Each
+call only fills in its placeholders, e.g. "{case_id}", in a copy of the
+stored dict. Every template has a fingerprint of what it is built from, the
+command tree or the config, and is rebuilt when the fingerprint changes.
+The command tree is not walked to fingerprint it. Its version is bumped by
+load() and tree_changed() instead.
+"""
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import discord
+from discord.ext import commands
+import config
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Embeds")
+
+# Help sections by cog name, in the order they are shown
+HELP_SECTIONS = {
+    "Setup": "Oppsett",
+    "Tickets": "Saker",
+    "Judge": "Dommer",
+    "Evidence": "Bevis",
+    "Notifications": "Varsler",
+    "Information": "Informasjon",
+}
+
+# Discord rejects embed field values longer than this
+FIELD_VALUE_LIMIT = 1024
+
+Builder = Callable[[commands.Bot], discord.Embed]
+Fingerprint = Callable[[commands.Bot], Hashable]
+
+_templates: Dict[str, Tuple[Builder, Fingerprint]] = {}
+_rendered: Dict[str, Tuple[Hashable, dict]] = {}
+_bot: Optional[commands.Bot] = None
+# Bumped whenever the registered slash commands may have changed
+_tree_version = 0
+
+def _config_fingerprint(bot: commands.Bot) -> Hashable:
+    """Fingerprint of the config values templates are built from"""
+    return repr((config.STATUS_MESSAGES, config.COLORS, config.MESSAGES))
+
+def _tree_fingerprint(bot: commands.Bot) -> Hashable:
+    """Fingerprint of the registered slash commands"""
+    return _tree_version
+
+def tree_changed():
+    """Rebuild the templates made from the command tree on their next render, called after a sync"""
+    global _tree_version
+    _tree_version += 1
+
+def _cog_name(command) -> Optional[str]:
+    binding = getattr(command, "binding", None)
+    return binding.qualified_name if binding else None
+
+def register(name: str, fingerprint: Fingerprint = _config_fingerprint):
+    """
+    Register a function that builds a template embed
+
+    Args:
+        name: The name the template is rendered by
+        fingerprint: Returns a value that changes whenever the template must be rebuilt
+    """
+    def decorator(builder: Builder) -> Builder:
+        _templates[name] = (builder, fingerprint)
+        return builder
+    return decorator
+
+def _template(name: str) -> dict:
+    builder, fingerprint = _templates[name]
+    current = fingerprint(_bot)
+    entry = _rendered.get(name)
+    if entry is None or entry[0] != current:
+        entry = (current, builder(_bot).to_dict())
+        _rendered[name] = entry
+        logger.debug(f"Built embed template '{name}'")
+    return entry[1]
+
+def _substitute(value: Any, values: Dict[str, Any]) -> Any:
+    # Every string goes through format, an escaped "}}" has no "{" to spot
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _substitute(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, values) for item in value]
+    return value
+
+def render(name: str, **values: Any) -> discord.Embed:
+    """
+    Render a registered embed
+
+    Args:
+        name: The template to render
+        **values: Values for the template's placeholders
+
+    Returns:
+        discord.Embed: A new embed, safe to change before sending
+    """
+    return discord.Embed.from_dict(_substitute(_template(name), values))
+
+def load(bot: commands.Bot):
+    """Build every registered template, called once the extensions are loaded"""
+    global _bot
+    _bot = bot
+    tree_changed()
+    _rendered.clear()
+    for name in _templates:
+        _template(name)
+    logger.info(f"Built {len(_templates)} embed template(s)")
+
+def _escape(text: str) -> str:
+    """Escape braces in text that is not a placeholder"""
+    return text.replace("{", "{{").replace("}", "}}")
+
+# Templates
+
+@register("help", _tree_fingerprint)
+def _help(bot: commands.Bot) -> discord.Embed:
+    embed = discord.Embed(
+        title="CourtBot Hjelp",
+        description="Her er en oversikt over tilgjengelige kommandoer:",
+        color=discord.Color.blue()
+    )
+
+    sections: Dict[str, list] = {section: [] for section in HELP_SECTIONS.values()}
+    for command in sorted(bot.tree.walk_commands(), key=lambda c: c.qualified_name):
+        if isinstance(command, discord.app_commands.Group):
+            continue
+        section = HELP_SECTIONS.get(_cog_name(command), "Annet")
+        sections.setdefault(section, []).append(
+            _escape(f"**/{command.qualified_name}** - {command.description}")
+        )
+
+    for section, lines in sections.items():
+        # Split long sections over several fields
+        value = ""
+        for line in lines:
+            if value and len(value) + len(line) + 1 > FIELD_VALUE_LIMIT:
+                embed.add_field(name=section, value=value, inline=False)
+                value = ""
+            value = f"{value}\n{line}" if value else line
+        if value:
+            embed.add_field(name=section, value=value, inline=False)
+
+    return embed
+
+@register("case_opened")
+def _case_opened(bot: commands.Bot) -> discord.Embed:
+    embed = discord.Embed(
+        title="Ny sak i {category}",
+        description="Velkommen til din nye sak. En dommer vil se på saken din så snart som mulig.",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="Sak ID", value="{case_id}", inline=True)
+    embed.add_field(name="Opprettet av", value="{creator}", inline=True)
+    embed.add_field(name="Status", value=_escape(config.STATUS_MESSAGES["åpen"]), inline=True)
+    embed.add_field(name="Opprettet", value="{created}", inline=True)
+    embed.set_footer(text="Sak #{case_id}")
+    return embed
+
+@register("case_closed")
+def _case_closed(bot: commands.Bot) -> discord.Embed:
+    embed = discord.Embed(
+        title="Sak lukket",
+        description="Denne saken har blitt lukket av {closed_by}.",
+        color=discord.Color.red()
+    )
+    embed.add_field(name="Lukket", value="{closed}", inline=True)
+    return embed
+
+@register("case_concluded")
+def _case_concluded(bot: commands.Bot) -> discord.Embed:
+    embed = discord.Embed(
+        title="Sak avsluttet",
+        description="Denne saken har blitt avsluttet av {closed_by}.",
+        color=discord.Color.red()
+    )
+    embed.add_field(name="Begrunnelse", value="{reason}", inline=False)
+    embed.add_field(name="Lukket", value="{closed}", inline=True)
+    embed.add_field(name="Arkiv", value="[Klikk her for å se arkivert sak]({archive_url})", inline=False)
+    return embed
+
+@register("case_concluded_dm")
+def _case_concluded_dm(bot: commands.Bot) -> discord.Embed:
+    embed = discord.Embed(
+        title="Din sak har blitt avsluttet",
+        description="Sak #{case_id} - {title} har blitt avsluttet av {closed_by}.",
+        color=discord.Color.red()
+    )
+    embed.add_field(name="Begrunnelse", value="{reason}", inline=False)
+    embed.add_field(name="Arkiv", value="[Klikk her for å se arkivert sak]({archive_url})", inline=False)
+    return embed
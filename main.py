@@ -1,13 +1,17 @@
 import discord
 from discord import app_commands, ui
 from discord.ext import commands, tasks
-import sqlite3
 import os
-import datetime
 import logging
 import json
 import asyncio
-from config import TOKEN, GUILD_ID
+from config import TOKEN, GUILD_ID, ARCHIVAL, CACHE
+import database
+import migrations
+import repository
+import cache
+import embeds
+import transcript
 
 # Set up logging
 logging.basicConfig(
@@ -24,166 +28,106 @@ logger = logging.getLogger("CourtBot")
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Initialize database connection
-def get_db_connection():
-    # Create database directory if it doesn't exist
-    os.makedirs('data', exist_ok=True)
-    conn = sqlite3.connect('data/courtbot.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Create the database tables if they don't exist
-def init_db():
-    logger.info("Initializing database...")
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Cases table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS cases (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        channel_id INTEGER UNIQUE,
-        category_id INTEGER,
-        creator_id INTEGER,
-        assigned_judge_id INTEGER NULL,
-        title TEXT,
-        description TEXT,
-        status TEXT DEFAULT 'Åpen',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        closed_at TIMESTAMP NULL,
-        closing_reason TEXT NULL,
-        archive_url TEXT NULL
-    )
-    ''')
-    
-    # Judges table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS judges (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER UNIQUE,
-        category_id INTEGER UNIQUE,
-        category_name TEXT
-    )
-    ''')
-    
-    # Categories table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category_id INTEGER UNIQUE,
-        name TEXT,
-        role_id INTEGER
-    )
-    ''')
-    
-    # Evidence table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS evidence (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        case_id INTEGER,
-        submitter_id INTEGER,
-        description TEXT,
-        link TEXT,
-        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (case_id) REFERENCES cases (id)
-    )
-    ''')
-    
-    # Scheduled notifications table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS scheduled_notifications (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        target_user_id INTEGER,
-        message TEXT,
-        scheduled_time TIMESTAMP,
-        created_by INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        sent BOOLEAN DEFAULT 0
-    )
-    ''')
-    
-    # Role permissions table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS role_permissions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        guild_id INTEGER,
-        function TEXT,
-        role_id INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(guild_id, function)
-    )
-    ''')
-    
-    # Ticket buttons table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS ticket_buttons (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category_id INTEGER,
-        title TEXT,
-        description TEXT,
-        emoji TEXT,
-        button_text TEXT,
-        role_id INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (category_id) REFERENCES categories (category_id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully")
+
+# Longest an interaction waits for the startup warm-up before it runs on cold caches
+WARM_UP_WAIT = 5
+
+class CourtTree(app_commands.CommandTree):
+    """Command tree that holds early interactions until the caches are warm"""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if not cache.is_warm() and not await cache.wait_warm(WARM_UP_WAIT):
+            logger.warning(f"Handling interaction from {interaction.user} before the caches are warm")
+        return True
+
+bot = commands.Bot(command_prefix='!', intents=intents, tree_cls=CourtTree)
+
+# Kept so the warm-up task is not garbage collected while it runs
+warm_up_task = None
+
+# Runs after login, before the gateway connects
+@bot.event
+async def setup_hook():
+    global warm_up_task
+    # Warm the caches while the gateway handshake is in progress
+    tickets = bot.get_cog("Tickets")
+    loaders = [transcript.load_exports()]
+    if tickets:
+        loaders.append(tickets.fetch_ticket_buttons())
+    warm_up_task = asyncio.create_task(cache.warm_up(*loaders))
 
 # On bot ready event
 @bot.event
 async def on_ready():
     logger.info(f'Bot is ready! Logged in as {bot.user} (ID: {bot.user.id})')
-    init_db()
-    check_scheduled_notifications.start()
+    if not cache.is_warm():
+        logger.info("Gateway is ready before the caches, interactions will wait for the warm-up")
+    if not check_scheduled_notifications.is_running():
+        check_scheduled_notifications.start()
+    if not archive_closed_cases.is_running():
+        archive_closed_cases.start()
+    if not poll_invalidations.is_running():
+        poll_invalidations.start()
+    if not prune_invalidations.is_running():
+        prune_invalidations.start()
     
     # Sync commands globally
     try:
         synced = await bot.tree.sync()
+        embeds.tree_changed()
         logger.info(f'Synced {len(synced)} command(s) globally')
     except Exception as e:
         logger.error(f'Failed to sync commands: {e}')
 
+# Keep cached role IDs in step with the guild's roles
+@bot.event
+async def on_guild_role_create(role):
+    cache.roles.invalidate(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    cache.roles.invalidate(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    cache.roles.invalidate(role.guild.id)
+
+# Keep member names current, and remember members who leave
+@bot.event
+async def on_member_update(before, after):
+    cache.members.invalidate(after.guild.id, after.id)
+
+@bot.event
+async def on_member_remove(member):
+    try:
+        await cache.members.remember(member)
+    except Exception as e:
+        logger.error(f"Could not store profile of departed member {member.id}: {e}")
+
 # Task to check for scheduled notifications
 @tasks.loop(minutes=1)
 async def check_scheduled_notifications():
     try:
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        conn = get_db_connection()
-        c = conn.cursor()
-        
         # Get all notifications that need to be sent
-        c.execute('''
-        SELECT * FROM scheduled_notifications 
-        WHERE scheduled_time <= ? AND sent = 0
-        ''', (current_time,))
-        
-        notifications = c.fetchall()
+        notifications = await repository.get_due_notifications()
         
         for notification in notifications:
-            user = bot.get_user(notification['target_user_id'])
+            user = bot.get_user(notification.target_user_id)
             if user:
                 try:
-                    await user.send(notification['message'])
-                    # Mark as sent
-                    c.execute('''
-                    UPDATE scheduled_notifications 
-                    SET sent = 1 
-                    WHERE id = ?
-                    ''', (notification['id'],))
-                    conn.commit()
-                    logger.info(f"Sent scheduled notification #{notification['id']} to {user.name}")
+                    await user.send(notification.message)
+                    logger.info(f"Sent scheduled notification #{notification.id} to {user.name}")
                 except Exception as e:
                     logger.error(f"Failed to send notification to {user.name}: {e}")
+                    continue
+                
+                # Mark it right away, so a crash later in the batch cannot send it twice
+                try:
+                    await repository.mark_notifications_sent([notification.id])
+                except Exception as e:
+                    logger.error(f"Failed to mark notification #{notification.id} as sent: {e}")
             else:
-                logger.error(f"Could not find user with ID {notification['target_user_id']}")
-        
-        conn.close()
+                logger.error(f"Could not find user with ID {notification.target_user_id}")
     except Exception as e:
         logger.error(f"Error in scheduled notifications task: {e}")
 
@@ -191,6 +135,44 @@ async def check_scheduled_notifications():
 async def before_check_notifications():
     await bot.wait_until_ready()
 
+# Task to move old closed cases out of the live tables
+@tasks.loop(minutes=ARCHIVAL["interval_minutes"])
+async def archive_closed_cases():
+    try:
+        total = 0
+        while True:
+            # Move one batch per transaction so other writes can run in between
+            moved = await repository.archive_closed_cases(ARCHIVAL["after_days"], ARCHIVAL["batch_size"])
+            total += moved
+            if moved < ARCHIVAL["batch_size"]:
+                break
+        if total:
+            logger.info(f"Moved {total} closed case(s) to the archive tables")
+    except Exception as e:
+        logger.error(f"Error in case archival task: {e}")
+
+@archive_closed_cases.before_loop
+async def before_archive_closed_cases():
+    await bot.wait_until_ready()
+
+# Task to pick up cache invalidations written by other processes
+@tasks.loop(seconds=CACHE["invalidation_poll_seconds"])
+async def poll_invalidations():
+    try:
+        await cache.bus.poll()
+    except Exception as e:
+        logger.error(f"Error polling cache invalidations: {e}")
+
+# Task to delete invalidations every process has seen
+@tasks.loop(minutes=CACHE["invalidation_retention_minutes"])
+async def prune_invalidations():
+    try:
+        pruned = await repository.prune_invalidations(CACHE["invalidation_retention_minutes"])
+        if pruned:
+            logger.info(f"Pruned {pruned} old cache invalidation(s)")
+    except Exception as e:
+        logger.error(f"Error pruning cache invalidations: {e}")
+
 # Error handling
 @bot.event
 async def on_command_error(ctx, error):
@@ -208,11 +190,19 @@ async def load_extensions():
     await bot.load_extension("cogs.evidence")
     await bot.load_extension("cogs.notifications")
     await bot.load_extension("cogs.information")
+    await bot.load_extension("cogs.capture")
 
 # Run the bot
 async def main():
-    await load_extensions()
-    await bot.start(TOKEN)
+    try:
+        # Apply pending schema migrations before any cog touches the database
+        await database.run(migrations.migrate)
+        # The caches are warmed in setup_hook, alongside the gateway connect
+        await load_extensions()
+        embeds.load(bot)
+        await bot.start(TOKEN)
+    finally:
+        await database.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,327 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Migrations")
+
+def _initial_schema(c: sqlite3.Cursor):
+    """Create the original tables"""
+    # Cases table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cases (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id INTEGER UNIQUE,
+        category_id INTEGER,
+        creator_id INTEGER,
+        assigned_judge_id INTEGER NULL,
+        title TEXT,
+        description TEXT,
+        status TEXT DEFAULT 'Åpen',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        closed_at TIMESTAMP NULL,
+        closing_reason TEXT NULL,
+        archive_url TEXT NULL
+    )
+    ''')
+
+    # Judges table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS judges (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE,
+        category_id INTEGER UNIQUE,
+        category_name TEXT
+    )
+    ''')
+
+    # Categories table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER UNIQUE,
+        name TEXT,
+        role_id INTEGER
+    )
+    ''')
+
+    # Evidence table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS evidence (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        case_id INTEGER,
+        submitter_id INTEGER,
+        description TEXT,
+        link TEXT,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (case_id) REFERENCES cases (id)
+    )
+    ''')
+
+    # Scheduled notifications table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS scheduled_notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        target_user_id INTEGER,
+        message TEXT,
+        scheduled_time TIMESTAMP,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent BOOLEAN DEFAULT 0
+    )
+    ''')
+
+    # Role permissions table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS role_permissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER,
+        function TEXT,
+        role_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(guild_id, function)
+    )
+    ''')
+
+    # Ticket buttons table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS ticket_buttons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER,
+        title TEXT,
+        description TEXT,
+        emoji TEXT,
+        button_text TEXT,
+        role_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories (category_id)
+    )
+    ''')
+
+def _add_indexes(c: sqlite3.Cursor):
+    """Add indexes for the hot lookups and reconcile ticket_buttons"""
+    # Older databases got ticket_buttons from the Tickets cog without created_at
+    columns = [row[1] for row in c.execute("PRAGMA table_info(ticket_buttons)")]
+    if 'created_at' not in columns:
+        c.execute("ALTER TABLE ticket_buttons ADD COLUMN created_at TIMESTAMP NULL")
+
+    # Open case listings: WHERE status = ? ORDER BY id DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cases_status ON cases (status, id)")
+
+    # Judge case listings and statistics: WHERE assigned_judge_id = ? ORDER BY id DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cases_assigned_judge ON cases (assigned_judge_id, id)")
+
+    # Evidence listings and counts: WHERE case_id = ? ORDER BY id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_evidence_case ON evidence (case_id, id)")
+
+    # Notification polling: WHERE sent = 0 AND scheduled_time <= ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_due ON scheduled_notifications (sent, scheduled_time)")
+
+    # Archive and cases category lookups: WHERE name = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_categories_name ON categories (name)")
+
+    # Ticket button loading: WHERE category_id = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ticket_buttons_category ON ticket_buttons (category_id)")
+
+def _evidence_ordinals(c: sqlite3.Cursor):
+    """Store per-case evidence ordinals and keep removed evidence as tombstones"""
+    c.execute("ALTER TABLE evidence ADD COLUMN ordinal INTEGER")
+    c.execute("ALTER TABLE evidence ADD COLUMN deleted_at TIMESTAMP NULL")
+
+    # Number existing evidence the same way the old COUNT(*)+1 scheme did
+    c.execute('''
+    UPDATE evidence
+    SET ordinal = (
+        SELECT COUNT(*) FROM evidence e
+        WHERE e.case_id = evidence.case_id AND e.id <= evidence.id
+    )
+    ''')
+
+    # Lookups by case.ordinal and per-case listings ordered by ordinal
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_evidence_case_ordinal ON evidence (case_id, ordinal)")
+    c.execute("DROP INDEX IF EXISTS idx_evidence_case")
+
+def _archive_tables(c: sqlite3.Cursor):
+    """Add cold tables that closed cases and their evidence are moved into"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cases_archive (
+        id INTEGER PRIMARY KEY,
+        channel_id INTEGER,
+        category_id INTEGER,
+        creator_id INTEGER,
+        assigned_judge_id INTEGER NULL,
+        title TEXT,
+        description TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        closed_at TIMESTAMP NULL,
+        closing_reason TEXT NULL,
+        archive_url TEXT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_archive (
+        id INTEGER PRIMARY KEY,
+        case_id INTEGER,
+        ordinal INTEGER,
+        submitter_id INTEGER,
+        description TEXT,
+        link TEXT,
+        submitted_at TIMESTAMP,
+        deleted_at TIMESTAMP NULL
+    )
+    ''')
+
+    # Channel lookups fall back to the archive: WHERE channel_id = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cases_archive_channel ON cases_archive (channel_id)")
+
+    # Judge case listings and statistics: WHERE assigned_judge_id = ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cases_archive_assigned_judge ON cases_archive (assigned_judge_id, id)")
+
+    # Evidence listings for archived cases: WHERE case_id = ? ORDER BY ordinal
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_evidence_archive_case_ordinal ON evidence_archive (case_id, ordinal)")
+
+    # The archival job picks closed cases by age: WHERE status IN (...) AND closed_at <= ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cases_status_closed ON cases (status, closed_at)")
+
+def _guild_config(c: sqlite3.Cursor):
+    """Per-guild record of the channels and roles the bot works with"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id INTEGER PRIMARY KEY,
+        archive_category_id INTEGER,
+        archive_log_channel_id INTEGER,
+        cases_category_id INTEGER,
+        judge_role_id INTEGER,
+        admin_role_id INTEGER
+    )
+    ''')
+
+def _member_profiles(c: sqlite3.Cursor):
+    """Last known name and avatar of members, kept for members who have left"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS member_profiles (
+        guild_id INTEGER,
+        user_id INTEGER,
+        display_name TEXT,
+        avatar_url TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (guild_id, user_id)
+    )
+    ''')
+
+def _cache_invalidations(c: sqlite3.Cursor):
+    """Change log that tells other processes which cached entries are stale"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cache_invalidations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        key INTEGER,
+        created_at TIMESTAMP
+    )
+    ''')
+
+    # Pruning old entries: WHERE created_at < ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_invalidations_created ON cache_invalidations (created_at)")
+
+def _transcript_exports(c: sqlite3.Cursor):
+    """Resume cursors of transcript exports, so an interrupted export continues where it stopped"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS transcript_exports (
+        channel_id INTEGER,
+        kind TEXT,
+        path TEXT NOT NULL,
+        last_message_id INTEGER,
+        message_count INTEGER DEFAULT 0,
+        file_offset INTEGER DEFAULT 0,
+        group_author_id INTEGER,
+        group_time TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (channel_id, kind)
+    )
+    ''')
+
+def _captured_messages(c: sqlite3.Cursor):
+    """Local copy of case channel messages, kept by live capture"""
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS captured_messages (
+        message_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        author_id INTEGER,
+        author_name TEXT,
+        avatar_url TEXT,
+        author_color INTEGER,
+        author_bot INTEGER,
+        content TEXT,
+        embeds TEXT,
+        attachments TEXT,
+        created_at TEXT
+    )
+    ''')
+
+    # Exports read a channel in message order: WHERE channel_id = ? AND message_id > ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_captured_messages_channel ON captured_messages (channel_id, message_id)")
+
+    # Channels whose whole history is in captured_messages
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS captured_channels (
+        channel_id INTEGER PRIMARY KEY,
+        captured_since TIMESTAMP
+    )
+    ''')
+
+# Ordered list of (version, description, function). Append new migrations to
+# the end; never edit or reorder one that has already shipped.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "Initial schema", _initial_schema),
+    (2, "Indexes for hot queries", _add_indexes),
+    (3, "Stored evidence ordinals", _evidence_ordinals),
+    (4, "Archive tables for closed cases", _archive_tables),
+    (5, "Guild configuration", _guild_config),
+    (6, "Member profiles", _member_profiles),
+    (7, "Cache invalidation log", _cache_invalidations),
+    (8, "Transcript export cursors", _transcript_exports),
+    (9, "Live message capture", _captured_messages),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the schema version recorded in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection):
+    """
+    Bring the database schema up to date
+
+    Every migration newer than the recorded schema version runs in its own
+    transaction together with the version bump, so a failed migration leaves
+    the database at the last good version.
+
+    Args:
+        conn: The database connection to migrate
+    """
+    current = get_schema_version(conn)
+    pending = [m for m in MIGRATIONS if m[0] > current]
+
+    if not pending:
+        logger.info(f"Database schema is up to date (version {current})")
+        return
+
+    for version, description, func in pending:
+        logger.info(f"Applying migration {version}: {description}")
+        c = conn.cursor()
+        c.execute("BEGIN")
+        try:
+            func(c)
+            c.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} failed, schema left at version {get_schema_version(conn)}")
+            raise
+
+    # Refresh query planner statistics for the new indexes
+    conn.execute("PRAGMA optimize")
+    logger.info(f"Database schema migrated to version {pending[-1][0]}")
@@ -0,0 +1,1094 @@
+"""
+Central query repository
+
+Every SQL statement the bot runs lives in this module as a named constant,
+and every query selects only the columns the caller needs. Rows come back
+as small __slots__ dataclasses instead of sqlite3.Row objects. Because the
+SQL text is constant, each pooled connection prepares a statement once and
+reuses it from its statement cache.
+"""
+import datetime
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import database
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Repository")
+
+@dataclass
+class Case:
+    """A row in the cases table"""
+    __slots__ = ('id', 'channel_id', 'category_id', 'creator_id', 'assigned_judge_id', 'title',
+                 'description', 'status', 'created_at', 'closed_at', 'closing_reason', 'archive_url')
+    id: int
+    channel_id: Optional[int]
+    category_id: Optional[int]
+    creator_id: int
+    assigned_judge_id: Optional[int]
+    title: str
+    description: str
+    status: str
+    created_at: Optional[str]
+    closed_at: Optional[str]
+    closing_reason: Optional[str]
+    archive_url: Optional[str]
+
+@dataclass
+class CaseSummary:
+    """The columns of a case shown in listings"""
+    __slots__ = ('id', 'channel_id', 'creator_id', 'title', 'status', 'created_at', 'archive_url')
+    id: int
+    channel_id: Optional[int]
+    creator_id: int
+    title: str
+    status: str
+    created_at: Optional[str]
+    archive_url: Optional[str]
+
+@dataclass
+class CaseStatistics:
+    """Case counts per status"""
+    __slots__ = ('total', 'open', 'assigned', 'closed', 'archived')
+    total: int
+    open: int
+    assigned: int
+    closed: int
+    archived: int
+
+@dataclass
+class JudgeStatistics:
+    """Case counts for a single judge"""
+    __slots__ = ('user_id', 'total_cases', 'closed_cases')
+    user_id: int
+    total_cases: int
+    closed_cases: int
+
+@dataclass
+class Evidence:
+    """A live (not removed) row in the evidence table"""
+    __slots__ = ('ordinal', 'submitter_id', 'description', 'link', 'submitted_at')
+    ordinal: int
+    submitter_id: int
+    description: str
+    link: str
+    submitted_at: str
+
+@dataclass
+class Judge:
+    """A row in the judges table"""
+    __slots__ = ('user_id', 'category_id', 'category_name')
+    user_id: int
+    category_id: int
+    category_name: str
+
+@dataclass
+class Category:
+    """A row in the categories table"""
+    __slots__ = ('category_id', 'name', 'role_id')
+    category_id: int
+    name: str
+    role_id: Optional[int]
+
+@dataclass
+class TicketButton:
+    """A row in the ticket_buttons table"""
+    __slots__ = ('category_id', 'title', 'description', 'emoji', 'button_text', 'role_id')
+    category_id: int
+    title: str
+    description: str
+    emoji: str
+    button_text: str
+    role_id: Optional[int]
+
+@dataclass
+class ScheduledNotification:
+    """A row in the scheduled_notifications table"""
+    __slots__ = ('id', 'target_user_id', 'message', 'scheduled_time', 'created_by', 'sent')
+    id: int
+    target_user_id: int
+    message: str
+    scheduled_time: str
+    created_by: int
+    sent: bool
+
+@dataclass
+class GuildConfig:
+    """A row in the guild_config table"""
+    __slots__ = ('guild_id', 'archive_category_id', 'archive_log_channel_id', 'cases_category_id',
+                 'judge_role_id', 'admin_role_id')
+    guild_id: int
+    archive_category_id: Optional[int]
+    archive_log_channel_id: Optional[int]
+    cases_category_id: Optional[int]
+    judge_role_id: Optional[int]
+    admin_role_id: Optional[int]
+
+@dataclass
+class MemberProfile:
+    """The name and avatar a member is shown with"""
+    __slots__ = ('user_id', 'display_name', 'avatar_url')
+    user_id: int
+    display_name: str
+    avatar_url: Optional[str]
+
+@dataclass
+class Invalidation:
+    """A row in the cache_invalidations table"""
+    __slots__ = ('id', 'topic', 'key')
+    id: int
+    topic: str
+    key: Optional[int]
+
+@dataclass
+class TranscriptExport:
+    """A row in the transcript_exports table, the resume cursor of an export"""
+    __slots__ = ('channel_id', 'kind', 'path', 'last_message_id', 'message_count', 'file_offset',
+                 'group_author_id', 'group_time')
+    channel_id: int
+    kind: str
+    path: str
+    last_message_id: Optional[int]
+    message_count: int
+    file_offset: int
+    group_author_id: Optional[int]
+    group_time: Optional[str]
+
+@dataclass
+class CapturedMessage:
+    """A row in the captured_messages table, embeds and attachments are JSON or None"""
+    __slots__ = ('message_id', 'channel_id', 'author_id', 'author_name', 'avatar_url', 'author_color',
+                 'author_bot', 'content', 'embeds', 'attachments', 'created_at')
+    message_id: int
+    channel_id: int
+    author_id: int
+    author_name: str
+    avatar_url: Optional[str]
+    author_color: int
+    author_bot: bool
+    content: str
+    embeds: Optional[str]
+    attachments: Optional[str]
+    created_at: str
+
+@dataclass
+class CaptureCursor:
+    """How far live capture has got in an active case channel"""
+    __slots__ = ('channel_id', 'complete', 'last_message_id')
+    channel_id: int
+    complete: bool
+    last_message_id: Optional[int]
+
+def _now() -> str:
+    """Current time in the format stored in the database"""
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+# Cache invalidations
+#
+# Writes that change cached data append an entry to cache_invalidations in
+# the same transaction. Other processes sharing the database poll the log and
+# drop their stale entries. Each process skips the entries it wrote itself,
+# because its own caches are updated as it writes.
+
+# Identifies this process in the invalidation log
+INSTANCE_ID = uuid.uuid4().hex
+
+TOPIC_PERMISSIONS = 'permissions'    # key: guild ID
+TOPIC_JUDGE = 'judge'                # key: user ID
+TOPIC_GUILD_CONFIG = 'guild_config'  # key: guild ID
+TOPIC_CASE = 'case'                  # key: case ID
+TOPIC_CASE_CHANNEL = 'case_channel'  # key: channel ID, a channel that became a case channel
+TOPIC_MEMBER = 'member'              # key: user ID
+
+SQL_PUBLISH_INVALIDATION = '''
+INSERT INTO cache_invalidations (origin, topic, key, created_at) VALUES (?, ?, ?, ?)
+'''
+
+SQL_PUBLISH_CASE_INVALIDATION = f'''
+INSERT INTO cache_invalidations (origin, topic, key, created_at)
+SELECT ?, '{TOPIC_CASE}', id, ? FROM (
+    SELECT id FROM cases WHERE channel_id = ?
+    UNION ALL
+    SELECT id FROM cases_archive WHERE channel_id = ?
+    LIMIT 1
+)
+'''
+
+SQL_LAST_INVALIDATION = 'SELECT COALESCE(MAX(id), 0) FROM cache_invalidations'
+
+SQL_INVALIDATIONS_AFTER = '''
+SELECT id, topic, key FROM cache_invalidations WHERE id > ? AND origin != ? ORDER BY id LIMIT ?
+'''
+
+SQL_PRUNE_INVALIDATIONS = 'DELETE FROM cache_invalidations WHERE created_at < ?'
+
+def _publish(conn, topic, key):
+    conn.execute(SQL_PUBLISH_INVALIDATION, (INSTANCE_ID, topic, key, _now()))
+
+def _publish_case(conn, channel_id):
+    conn.execute(SQL_PUBLISH_CASE_INVALIDATION, (INSTANCE_ID, _now(), channel_id, channel_id))
+
+async def get_last_invalidation_id() -> int:
+    """Get the ID of the newest invalidation, where a new process starts polling"""
+    return (await database.fetchone(SQL_LAST_INVALIDATION))[0]
+
+async def get_invalidations(after_id: int, limit: int) -> List[Invalidation]:
+    """Get invalidations written by other processes after the given ID, oldest first"""
+    rows = await database.fetchall(SQL_INVALIDATIONS_AFTER, (after_id, INSTANCE_ID, limit))
+    return [Invalidation(*row) for row in rows]
+
+async def prune_invalidations(older_than_minutes: int) -> int:
+    """
+    Delete invalidations every process has had time to see
+
+    Returns:
+        int: The number of invalidations deleted
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(minutes=older_than_minutes)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = await database.execute(SQL_PRUNE_INVALIDATIONS, (cutoff,))
+    return cursor.rowcount
+
+# Cases
+
+_CASE_COLUMNS = '''id, channel_id, category_id, creator_id, assigned_judge_id, title,
+    description, status, created_at, closed_at, closing_reason, archive_url'''
+
+_CASE_SUMMARY_COLUMNS = 'id, channel_id, creator_id, title, status, created_at, archive_url'
+
+# Closed cases are moved to cases_archive after a while, so single-case
+# lookups fall back to the archive when the live table has no match
+SQL_CASE_BY_ID = f'''
+SELECT {_CASE_COLUMNS} FROM cases WHERE id = ?
+UNION ALL
+SELECT {_CASE_COLUMNS} FROM cases_archive WHERE id = ?
+LIMIT 1
+'''
+
+SQL_CASE_BY_CHANNEL = f'''
+SELECT {_CASE_COLUMNS} FROM cases WHERE channel_id = ?
+UNION ALL
+SELECT {_CASE_COLUMNS} FROM cases_archive WHERE channel_id = ?
+LIMIT 1
+'''
+
+SQL_RESERVE_CASE = '''
+INSERT INTO cases (category_id, creator_id, title, description, status)
+VALUES (?, ?, ?, ?, 'Reservert')
+'''
+
+SQL_OPEN_RESERVED_CASE = '''
+UPDATE cases SET channel_id = ?, status = 'Åpen'
+WHERE id = ? AND status = 'Reservert' AND channel_id IS NULL
+'''
+
+SQL_RELEASE_RESERVATION = 'DELETE FROM cases WHERE id = ? AND channel_id IS NULL'
+
+# created_at of a reservation is the column default, CURRENT_TIMESTAMP in UTC,
+# so the cutoff is computed in SQLite as well
+SQL_CLEAR_RESERVATIONS = '''
+DELETE FROM cases
+WHERE status = 'Reservert' AND channel_id IS NULL AND created_at < datetime('now', ?)
+'''
+
+# Reservations older than this were left behind by a crash; younger ones may
+# belong to a ticket another process is creating right now
+RESERVATION_TIMEOUT_MINUTES = 60
+
+SQL_CLAIM_CASE = '''
+UPDATE cases SET assigned_judge_id = ?, category_id = ?, status = 'Under behandling' WHERE channel_id = ?
+'''
+
+SQL_MOVE_CASE = 'UPDATE cases SET category_id = ? WHERE channel_id = ?'
+
+SQL_CLOSE_CASE = '''
+UPDATE cases
+SET status = 'Lukket', closed_at = ?,
+    closing_reason = COALESCE(?, closing_reason),
+    archive_url = COALESCE(?, archive_url)
+WHERE channel_id = ?
+'''
+
+SQL_CASES_FOR_JUDGE = f'''
+SELECT {_CASE_SUMMARY_COLUMNS} FROM cases WHERE assigned_judge_id = ?
+UNION ALL
+SELECT {_CASE_SUMMARY_COLUMNS} FROM cases_archive WHERE assigned_judge_id = ?
+ORDER BY id DESC
+'''
+
+SQL_OPEN_CASES = f'''
+SELECT {_CASE_SUMMARY_COLUMNS} FROM cases WHERE status = 'Åpen' ORDER BY id DESC
+'''
+
+SQL_ACTIVE_CASES = f'''
+SELECT {_CASE_COLUMNS} FROM cases
+WHERE status IN ('Åpen', 'Under behandling') AND channel_id IS NOT NULL
+ORDER BY id DESC LIMIT ?
+'''
+
+SQL_SEARCH_CLOSED_CASES = f'''
+SELECT {_CASE_SUMMARY_COLUMNS} FROM cases
+WHERE (title LIKE ? OR description LIKE ?)
+AND (status = 'Lukket' OR status = 'Arkivert')
+UNION ALL
+SELECT {_CASE_SUMMARY_COLUMNS} FROM cases_archive
+WHERE (title LIKE ? OR description LIKE ?)
+ORDER BY id DESC
+LIMIT ?
+'''
+
+SQL_CASE_STATISTICS = '''
+SELECT
+    COUNT(*) as total,
+    COALESCE(SUM(CASE WHEN status = 'Åpen' THEN 1 ELSE 0 END), 0) as open,
+    COALESCE(SUM(CASE WHEN status = 'Tildelt' THEN 1 ELSE 0 END), 0) as assigned,
+    COALESCE(SUM(CASE WHEN status = 'Lukket' THEN 1 ELSE 0 END), 0) as closed,
+    COALESCE(SUM(CASE WHEN status = 'Arkivert' THEN 1 ELSE 0 END), 0) as archived
+FROM (
+    SELECT status FROM cases WHERE status != 'Reservert'
+    UNION ALL
+    SELECT status FROM cases_archive
+)
+'''
+
+SQL_JUDGE_STATISTICS = '''
+SELECT
+    j.user_id,
+    COUNT(c.id) as total_cases,
+    COALESCE(SUM(CASE WHEN c.status = 'Lukket' THEN 1 ELSE 0 END), 0) as closed_cases
+FROM judges j
+LEFT JOIN (
+    SELECT id, assigned_judge_id, status FROM cases
+    UNION ALL
+    SELECT id, assigned_judge_id, status FROM cases_archive
+) c ON j.user_id = c.assigned_judge_id
+WHERE j.user_id IS NOT NULL
+GROUP BY j.user_id
+'''
+
+async def get_case(case_id: int) -> Optional[Case]:
+    """Get a case by its ID"""
+    row = await database.fetchone(SQL_CASE_BY_ID, (case_id, case_id))
+    return Case(*row) if row else None
+
+async def get_case_by_channel(channel_id: int) -> Optional[Case]:
+    """Get the case that belongs to a channel"""
+    row = await database.fetchone(SQL_CASE_BY_CHANNEL, (channel_id, channel_id))
+    return Case(*row) if row else None
+
+async def reserve_case(category_id: int, creator_id: int, title: str, description: str) -> int:
+    """Insert a reserved case without a channel and return its ID"""
+    cursor = await database.execute(SQL_RESERVE_CASE, (category_id, creator_id, title, description))
+    return cursor.lastrowid
+
+def _open_reserved_case(conn, case_id, channel_id):
+    cursor = conn.execute(SQL_OPEN_RESERVED_CASE, (channel_id, case_id))
+    if cursor.rowcount != 1:
+        raise LookupError(f"Case {case_id} is no longer reserved")
+    _publish(conn, TOPIC_CASE, case_id)
+    # Other processes may have cached the channel as not being a case channel
+    _publish(conn, TOPIC_CASE_CHANNEL, channel_id)
+
+async def open_reserved_case(case_id: int, channel_id: int):
+    """
+    Attach a channel to a reserved case and open it
+
+    Raises:
+        LookupError: If the reservation is gone, e.g. cleared as stale
+    """
+    await database.write(_open_reserved_case, case_id, channel_id)
+
+async def release_reservation(case_id: int):
+    """Delete a reserved case that never got a channel"""
+    await database.execute(SQL_RELEASE_RESERVATION, (case_id,))
+
+async def clear_stale_reservations(older_than_minutes: int = RESERVATION_TIMEOUT_MINUTES):
+    """Delete reserved cases that never got a channel and are too old to still be in use"""
+    await database.execute(SQL_CLEAR_RESERVATIONS, (f'-{older_than_minutes} minutes',))
+
+def _update_case(conn, query, params, channel_id):
+    # Only live cases can change; an archived case is no longer in the cases table
+    if conn.execute(query, params).rowcount == 0:
+        raise LookupError(f"No live case in channel {channel_id}, it may have been archived")
+    _publish_case(conn, channel_id)
+
+async def claim_case(channel_id: int, judge_id: int, category_id: int):
+    """
+    Assign a case to a judge, move it to the judge's category and mark it as under treatment
+
+    Raises:
+        LookupError: If the case has been moved to the archive tables
+    """
+    await database.write(_update_case, SQL_CLAIM_CASE, (judge_id, category_id, channel_id), channel_id)
+
+async def move_case(channel_id: int, category_id: int):
+    """
+    Record that a case channel has moved to another category
+
+    Raises:
+        LookupError: If the case has been moved to the archive tables
+    """
+    await database.write(_update_case, SQL_MOVE_CASE, (category_id, channel_id), channel_id)
+
+async def close_case(channel_id: int, closing_reason: Optional[str] = None, archive_url: Optional[str] = None) -> str:
+    """
+    Mark a case as closed, optionally recording the reason and archive URL
+
+    Returns:
+        str: The time the case was closed, as stored in the database
+
+    Raises:
+        LookupError: If the case has been moved to the archive tables
+    """
+    closed_at = _now()
+    await database.write(_update_case, SQL_CLOSE_CASE, (closed_at, closing_reason, archive_url, channel_id), channel_id)
+    return closed_at
+
+def _fetch_summaries(conn, query, params=()):
+    return [CaseSummary(*row) for row in conn.execute(query, params)]
+
+def _fetch_statistics(conn):
+    case_stats = CaseStatistics(*conn.execute(SQL_CASE_STATISTICS).fetchone())
+    judge_stats = [JudgeStatistics(*row) for row in conn.execute(SQL_JUDGE_STATISTICS)]
+    return case_stats, judge_stats
+
+async def get_cases_for_judge(judge_id: int) -> List[CaseSummary]:
+    """Get all cases assigned to a judge, newest first, from a read snapshot"""
+    return await database.snapshot(_fetch_summaries, SQL_CASES_FOR_JUDGE, (judge_id, judge_id))
+
+async def get_open_cases() -> List[CaseSummary]:
+    """Get all open cases, newest first, from a read snapshot"""
+    return await database.snapshot(_fetch_summaries, SQL_OPEN_CASES)
+
+async def get_active_cases(limit: int) -> List[Case]:
+    """Get the newest cases that are open or being handled, used to warm the case cache"""
+    rows = await database.fetchall(SQL_ACTIVE_CASES, (limit,))
+    return [Case(*row) for row in rows]
+
+async def search_closed_cases(term: str, limit: int = 10) -> List[CaseSummary]:
+    """Search closed and archived cases by title or description from a read snapshot"""
+    pattern = f'%{term}%'
+    return await database.snapshot(_fetch_summaries, SQL_SEARCH_CLOSED_CASES, (pattern, pattern, pattern, pattern, limit))
+
+async def get_statistics() -> Tuple[CaseStatistics, List[JudgeStatistics]]:
+    """
+    Count cases per status and per judge
+
+    Both aggregates run in the same read snapshot, so they always agree
+    with each other even while cases are being created or closed.
+
+    Returns:
+        tuple: The case statistics and the statistics for each judge
+    """
+    return await database.snapshot(_fetch_statistics)
+
+# Evidence
+
+# Evidence for archived cases lives in evidence_archive. New evidence always
+# goes into the live table and is swept into the archive by the next
+# archival run, so ordinals are allocated across both tables.
+SQL_INSERT_EVIDENCE = '''
+INSERT INTO evidence (case_id, ordinal, submitter_id, description, link)
+SELECT ?, COALESCE(MAX(ordinal), 0) + 1, ?, ?, ?
+FROM (
+    SELECT ordinal FROM evidence WHERE case_id = ?
+    UNION ALL
+    SELECT ordinal FROM evidence_archive WHERE case_id = ?
+)
+'''
+
+SQL_EVIDENCE_ORDINAL = 'SELECT ordinal FROM evidence WHERE id = ?'
+
+SQL_LIVE_EVIDENCE_BY_ORDINAL = '''
+SELECT id, description FROM evidence
+WHERE case_id = ? AND ordinal = ? AND deleted_at IS NULL
+'''
+
+SQL_LIVE_ARCHIVED_EVIDENCE_BY_ORDINAL = '''
+SELECT id, description FROM evidence_archive
+WHERE case_id = ? AND ordinal = ? AND deleted_at IS NULL
+'''
+
+SQL_TOMBSTONE_EVIDENCE = 'UPDATE evidence SET deleted_at = ? WHERE id = ?'
+
+SQL_TOMBSTONE_ARCHIVED_EVIDENCE = 'UPDATE evidence_archive SET deleted_at = ? WHERE id = ?'
+
+SQL_EVIDENCE_FOR_CASE = '''
+SELECT ordinal, submitter_id, description, link, submitted_at FROM evidence
+WHERE case_id = ? AND deleted_at IS NULL
+UNION ALL
+SELECT ordinal, submitter_id, description, link, submitted_at FROM evidence_archive
+WHERE case_id = ? AND deleted_at IS NULL
+ORDER BY ordinal
+'''
+
+SQL_COUNT_EVIDENCE = '''
+SELECT
+    (SELECT COUNT(*) FROM evidence WHERE case_id = ? AND deleted_at IS NULL) +
+    (SELECT COUNT(*) FROM evidence_archive WHERE case_id = ? AND deleted_at IS NULL)
+'''
+
+def _insert_evidence(conn, case_id, submitter_id, description, link):
+    # A single INSERT ... SELECT allocates the ordinal atomically. Removed
+    # evidence is kept as tombstones, so MAX(ordinal) never goes backwards.
+    cursor = conn.execute(SQL_INSERT_EVIDENCE, (case_id, submitter_id, description, link, case_id, case_id))
+    _publish(conn, TOPIC_CASE, case_id)
+    return conn.execute(SQL_EVIDENCE_ORDINAL, (cursor.lastrowid,)).fetchone()[0]
+
+def _remove_evidence(conn, case_id, ordinal):
+    for select, tombstone in ((SQL_LIVE_EVIDENCE_BY_ORDINAL, SQL_TOMBSTONE_EVIDENCE),
+                              (SQL_LIVE_ARCHIVED_EVIDENCE_BY_ORDINAL, SQL_TOMBSTONE_ARCHIVED_EVIDENCE)):
+        row = conn.execute(select, (case_id, ordinal)).fetchone()
+        if row:
+            conn.execute(tombstone, (_now(), row[0]))
+            _publish(conn, TOPIC_CASE, case_id)
+            return row[1]
+    return None
+
+async def add_evidence(case_id: int, submitter_id: int, description: str, link: str) -> int:
+    """Add evidence to a case and return its ordinal within the case"""
+    return await database.write(_insert_evidence, case_id, submitter_id, description, link)
+
+async def remove_evidence(case_id: int, ordinal: int) -> Optional[str]:
+    """
+    Mark evidence as removed, keeping its ordinal reserved
+
+    Returns:
+        str: The description of the removed evidence, or None if it was not found
+    """
+    return await database.write(_remove_evidence, case_id, ordinal)
+
+async def get_evidence(case_id: int) -> List[Evidence]:
+    """Get all live evidence for a case in ordinal order"""
+    rows = await database.fetchall(SQL_EVIDENCE_FOR_CASE, (case_id, case_id))
+    return [Evidence(*row) for row in rows]
+
+async def count_evidence(case_id: int) -> int:
+    """Count live evidence for a case"""
+    return (await database.fetchone(SQL_COUNT_EVIDENCE, (case_id, case_id)))[0]
+
+# Archival
+
+# Closed cases old enough to move, oldest first. Every statement below
+# selects the same batch because the cases are only deleted at the end.
+_ARCHIVABLE_CASES = '''
+SELECT id FROM cases
+WHERE status IN ('Lukket', 'Arkivert') AND COALESCE(closed_at, created_at) <= ?
+ORDER BY id
+LIMIT ?
+'''
+
+_EVIDENCE_COLUMNS = 'id, case_id, ordinal, submitter_id, description, link, submitted_at, deleted_at'
+
+SQL_ARCHIVE_CASES = f'''
+INSERT INTO cases_archive ({_CASE_COLUMNS}, archived_at)
+SELECT {_CASE_COLUMNS}, ? FROM cases WHERE id IN ({_ARCHIVABLE_CASES})
+'''
+
+SQL_ARCHIVE_CASE_EVIDENCE = f'''
+INSERT INTO evidence_archive ({_EVIDENCE_COLUMNS})
+SELECT {_EVIDENCE_COLUMNS} FROM evidence WHERE case_id IN ({_ARCHIVABLE_CASES})
+'''
+
+SQL_DELETE_CASE_EVIDENCE = f'DELETE FROM evidence WHERE case_id IN ({_ARCHIVABLE_CASES})'
+
+SQL_DELETE_ARCHIVED_CASES = f'DELETE FROM cases WHERE id IN ({_ARCHIVABLE_CASES})'
+
+# Evidence added to a case after it was archived
+SQL_SWEEP_LATE_EVIDENCE = f'''
+INSERT INTO evidence_archive ({_EVIDENCE_COLUMNS})
+SELECT {_EVIDENCE_COLUMNS} FROM evidence
+WHERE EXISTS (SELECT 1 FROM cases_archive a WHERE a.id = evidence.case_id)
+'''
+
+SQL_DELETE_LATE_EVIDENCE = '''
+DELETE FROM evidence
+WHERE EXISTS (SELECT 1 FROM cases_archive a WHERE a.id = evidence.case_id)
+'''
+
+def _archive_closed_cases(conn, cutoff, batch_size):
+    conn.execute(SQL_SWEEP_LATE_EVIDENCE)
+    conn.execute(SQL_DELETE_LATE_EVIDENCE)
+
+    moved = conn.execute(SQL_ARCHIVE_CASES, (_now(), cutoff, batch_size)).rowcount
+    if moved:
+        conn.execute(SQL_ARCHIVE_CASE_EVIDENCE, (cutoff, batch_size))
+        conn.execute(SQL_DELETE_CASE_EVIDENCE, (cutoff, batch_size))
+        conn.execute(SQL_DELETE_ARCHIVED_CASES, (cutoff, batch_size))
+    return moved
+
+async def archive_closed_cases(after_days: int, batch_size: int) -> int:
+    """
+    Move one batch of old closed cases and their evidence to the archive tables
+
+    Args:
+        after_days: How many days a case must have been closed before it is moved
+        batch_size: The most cases to move in one transaction
+
+    Returns:
+        int: The number of cases moved
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=after_days)).strftime('%Y-%m-%d %H:%M:%S')
+    return await database.write(_archive_closed_cases, cutoff, batch_size)
+
+# Judges
+
+SQL_ALL_JUDGES = 'SELECT user_id, category_id, category_name FROM judges WHERE user_id IS NOT NULL'
+
+SQL_UPDATE_JUDGE = 'UPDATE judges SET category_id = ?, category_name = ? WHERE user_id = ?'
+
+SQL_INSERT_JUDGE = 'INSERT INTO judges (user_id, category_id, category_name) VALUES (?, ?, ?)'
+
+SQL_DELETE_JUDGE = 'DELETE FROM judges WHERE user_id = ?'
+
+def _save_judge(conn, user_id, category_id, category_name):
+    _publish(conn, TOPIC_JUDGE, user_id)
+    cursor = conn.execute(SQL_UPDATE_JUDGE, (category_id, category_name, user_id))
+    if cursor.rowcount:
+        return True
+    conn.execute(SQL_INSERT_JUDGE, (user_id, category_id, category_name))
+    return False
+
+async def get_judges() -> List[Judge]:
+    """Get every registered judge"""
+    rows = await database.fetchall(SQL_ALL_JUDGES)
+    return [Judge(*row) for row in rows]
+
+async def save_judge(user_id: int, category_id: int, category_name: str) -> bool:
+    """
+    Register a judge or move an existing judge to a new category
+
+    Returns:
+        bool: True if the judge already existed, False if it was added
+    """
+    return await database.write(_save_judge, user_id, category_id, category_name)
+
+def _delete_judge(conn, user_id):
+    conn.execute(SQL_DELETE_JUDGE, (user_id,))
+    _publish(conn, TOPIC_JUDGE, user_id)
+
+async def delete_judge(user_id: int):
+    """Remove a judge"""
+    await database.write(_delete_judge, user_id)
+
+# Categories
+
+SQL_CATEGORY_BY_ID = 'SELECT category_id, name, role_id FROM categories WHERE category_id = ?'
+
+SQL_CATEGORY_BY_NAME = 'SELECT category_id, name, role_id FROM categories WHERE name = ?'
+
+SQL_CATEGORY_BY_ID_AND_NAME = '''
+SELECT category_id, name, role_id FROM categories WHERE category_id = ? AND name = ?
+'''
+
+SQL_FIND_CATEGORIES = 'SELECT category_id, name, role_id FROM categories WHERE name LIKE ?'
+
+SQL_ALL_CATEGORIES = 'SELECT category_id, name, role_id FROM categories'
+
+SQL_INSERT_CATEGORY = 'INSERT INTO categories (category_id, name, role_id) VALUES (?, ?, ?)'
+
+SQL_UPDATE_CATEGORY = 'UPDATE categories SET name = ?, role_id = ? WHERE category_id = ?'
+
+SQL_MOVE_NAMED_CATEGORY = 'UPDATE categories SET category_id = ? WHERE name = ?'
+
+SQL_DELETE_CATEGORY = 'DELETE FROM categories WHERE category_id = ?'
+
+def _save_category(conn, category_id, name, role_id):
+    cursor = conn.execute(SQL_UPDATE_CATEGORY, (name, role_id, category_id))
+    if not cursor.rowcount:
+        conn.execute(SQL_INSERT_CATEGORY, (category_id, name, role_id))
+
+def _set_named_category(conn, name, category_id):
+    cursor = conn.execute(SQL_MOVE_NAMED_CATEGORY, (category_id, name))
+    if cursor.rowcount:
+        return True
+    conn.execute(SQL_INSERT_CATEGORY, (category_id, name, 0))
+    return False
+
+async def get_category(category_id: int) -> Optional[Category]:
+    """Get a category by its Discord ID"""
+    row = await database.fetchone(SQL_CATEGORY_BY_ID, (category_id,))
+    return Category(*row) if row else None
+
+async def get_category_by_name(name: str) -> Optional[Category]:
+    """Get a category by its exact name, e.g. 'Arkiv' or 'Saker'"""
+    row = await database.fetchone(SQL_CATEGORY_BY_NAME, (name,))
+    return Category(*row) if row else None
+
+async def is_named_category(category_id: int, name: str) -> bool:
+    """Check if a category is registered under the given name"""
+    return await database.fetchone(SQL_CATEGORY_BY_ID_AND_NAME, (category_id, name)) is not None
+
+async def find_categories(name: str) -> List[Category]:
+    """Find categories whose name contains the given text"""
+    rows = await database.fetchall(SQL_FIND_CATEGORIES, (f'%{name}%',))
+    return [Category(*row) for row in rows]
+
+async def get_categories() -> List[Category]:
+    """Get all registered categories"""
+    rows = await database.fetchall(SQL_ALL_CATEGORIES)
+    return [Category(*row) for row in rows]
+
+async def add_category(category_id: int, name: str, role_id: int = 0):
+    """Register a new category"""
+    await database.execute(SQL_INSERT_CATEGORY, (category_id, name, role_id))
+
+async def save_category(category_id: int, name: str, role_id: int):
+    """Register a category or update its name and role"""
+    await database.write(_save_category, category_id, name, role_id)
+
+async def set_named_category(name: str, category_id: int) -> bool:
+    """
+    Point a named category (e.g. 'Arkiv') at a Discord category
+
+    Returns:
+        bool: True if the named category already existed, False if it was added
+    """
+    return await database.write(_set_named_category, name, category_id)
+
+async def move_named_category(name: str, category_id: int):
+    """Point an existing named category at a new Discord category"""
+    await database.execute(SQL_MOVE_NAMED_CATEGORY, (category_id, name))
+
+async def delete_category(category_id: int):
+    """Remove a category"""
+    await database.execute(SQL_DELETE_CATEGORY, (category_id,))
+
+# Ticket buttons
+
+SQL_ALL_TICKET_BUTTONS = '''
+SELECT b.category_id, b.title, b.description, b.emoji, b.button_text, b.role_id
+FROM ticket_buttons b
+JOIN categories c ON c.category_id = b.category_id
+'''
+
+SQL_UPDATE_TICKET_BUTTON = '''
+UPDATE ticket_buttons
+SET title = ?, description = ?, emoji = ?, button_text = ?, role_id = ?
+WHERE category_id = ?
+'''
+
+SQL_INSERT_TICKET_BUTTON = '''
+INSERT INTO ticket_buttons (category_id, title, description, emoji, button_text, role_id)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def _save_ticket_button(conn, category_id, title, description, emoji, button_text, role_id):
+    cursor = conn.execute(SQL_UPDATE_TICKET_BUTTON, (title, description, emoji, button_text, role_id, category_id))
+    if cursor.rowcount:
+        return True
+    conn.execute(SQL_INSERT_TICKET_BUTTON, (category_id, title, description, emoji, button_text, role_id))
+    return False
+
+async def get_ticket_buttons() -> List[TicketButton]:
+    """Get all ticket buttons whose category is registered"""
+    rows = await database.fetchall(SQL_ALL_TICKET_BUTTONS)
+    return [TicketButton(*row) for row in rows]
+
+async def save_ticket_button(category_id: int, title: str, description: str, emoji: str,
+                             button_text: str, role_id: int) -> bool:
+    """
+    Store the ticket button for a category
+
+    Returns:
+        bool: True if an existing button was updated, False if it was added
+    """
+    return await database.write(_save_ticket_button, category_id, title, description, emoji, button_text, role_id)
+
+# Role permissions
+
+SQL_ALL_PERMISSIONS = 'SELECT guild_id, function, role_id FROM role_permissions'
+
+SQL_GUILD_PERMISSIONS = 'SELECT function, role_id FROM role_permissions WHERE guild_id = ?'
+
+SQL_UPDATE_PERMISSION = 'UPDATE role_permissions SET role_id = ? WHERE function = ? AND guild_id = ?'
+
+SQL_INSERT_PERMISSION = 'INSERT INTO role_permissions (guild_id, function, role_id) VALUES (?, ?, ?)'
+
+def _set_role_permission(conn, guild_id, function, role_id):
+    _publish(conn, TOPIC_PERMISSIONS, guild_id)
+    cursor = conn.execute(SQL_UPDATE_PERMISSION, (role_id, function, guild_id))
+    if cursor.rowcount:
+        return True
+    conn.execute(SQL_INSERT_PERMISSION, (guild_id, function, role_id))
+    return False
+
+async def get_role_permissions(guild_id: int) -> Dict[str, int]:
+    """Get all function-to-role assignments for a guild"""
+    rows = await database.fetchall(SQL_GUILD_PERMISSIONS, (guild_id,))
+    return {row[0]: row[1] for row in rows}
+
+async def get_all_role_permissions() -> Dict[int, Dict[str, int]]:
+    """Get the function-to-role assignments of every guild, keyed by guild ID"""
+    permissions: Dict[int, Dict[str, int]] = {}
+    for guild_id, function, role_id in await database.fetchall(SQL_ALL_PERMISSIONS):
+        permissions.setdefault(guild_id, {})[function] = role_id
+    return permissions
+
+async def set_role_permission(guild_id: int, function: str, role_id: int) -> bool:
+    """
+    Assign a role to a function in a guild
+
+    Returns:
+        bool: True if an existing assignment was updated, False if it was added
+    """
+    return await database.write(_set_role_permission, guild_id, function, role_id)
+
+# Guild configuration
+
+GUILD_CONFIG_FIELDS = ('archive_category_id', 'archive_log_channel_id', 'cases_category_id',
+                       'judge_role_id', 'admin_role_id')
+
+SQL_ALL_GUILD_CONFIGS = f'SELECT guild_id, {", ".join(GUILD_CONFIG_FIELDS)} FROM guild_config'
+
+SQL_GUILD_CONFIG = f'SELECT guild_id, {", ".join(GUILD_CONFIG_FIELDS)} FROM guild_config WHERE guild_id = ?'
+
+SQL_INSERT_GUILD_CONFIG = 'INSERT OR IGNORE INTO guild_config (guild_id) VALUES (?)'
+
+# One statement per field, so the SQL text stays constant
+SQL_UPDATE_GUILD_CONFIG = {
+    field: f'UPDATE guild_config SET {field} = ? WHERE guild_id = ?' for field in GUILD_CONFIG_FIELDS
+}
+
+def _set_guild_config(conn, guild_id, values):
+    conn.execute(SQL_INSERT_GUILD_CONFIG, (guild_id,))
+    _publish(conn, TOPIC_GUILD_CONFIG, guild_id)
+    for field, value in values.items():
+        conn.execute(SQL_UPDATE_GUILD_CONFIG[field], (value, guild_id))
+
+async def get_guild_config(guild_id: int) -> Optional[GuildConfig]:
+    """Get the configuration of one guild, or None if it has none"""
+    row = await database.fetchone(SQL_GUILD_CONFIG, (guild_id,))
+    return GuildConfig(*row) if row else None
+
+async def get_guild_configs() -> Dict[int, GuildConfig]:
+    """Get the configuration of every guild, keyed by guild ID"""
+    rows = await database.fetchall(SQL_ALL_GUILD_CONFIGS)
+    return {row[0]: GuildConfig(*row) for row in rows}
+
+async def set_guild_config(guild_id: int, **values: Optional[int]):
+    """
+    Update fields of a guild's configuration, adding the guild if needed
+
+    Args:
+        guild_id: The guild to update
+        **values: New values keyed by field name, see GUILD_CONFIG_FIELDS
+    """
+    unknown = set(values) - set(GUILD_CONFIG_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown guild config field(s): {', '.join(sorted(unknown))}")
+    await database.write(_set_guild_config, guild_id, values)
+
+# Member profiles
+
+# The user IDs are passed as one JSON array, so the SQL text stays constant
+# however many members are looked up
+SQL_MEMBER_PROFILES = '''
+SELECT user_id, display_name, avatar_url FROM member_profiles
+WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?))
+'''
+
+SQL_SAVE_MEMBER_PROFILE = '''
+INSERT OR REPLACE INTO member_profiles (guild_id, user_id, display_name, avatar_url, updated_at)
+VALUES (?, ?, ?, ?, ?)
+'''
+
+async def get_member_profiles(guild_id: int, user_ids: List[int]) -> Dict[int, MemberProfile]:
+    """Get the stored profiles of some members of a guild, keyed by user ID"""
+    rows = await database.fetchall(SQL_MEMBER_PROFILES, (guild_id, json.dumps(user_ids)))
+    return {row[0]: MemberProfile(*row) for row in rows}
+
+def _save_member_profile(conn, guild_id, profile):
+    conn.execute(SQL_SAVE_MEMBER_PROFILE, (guild_id, profile.user_id, profile.display_name, profile.avatar_url, _now()))
+    _publish(conn, TOPIC_MEMBER, profile.user_id)
+
+async def save_member_profile(guild_id: int, profile: MemberProfile):
+    """Store the last known profile of a member"""
+    await database.write(_save_member_profile, guild_id, profile)
+
+# Transcript exports
+
+SQL_TRANSCRIPT_EXPORT = '''
+SELECT channel_id, kind, path, last_message_id, message_count, file_offset, group_author_id, group_time
+FROM transcript_exports WHERE channel_id = ? AND kind = ?
+'''
+
+SQL_CHANNEL_TRANSCRIPT_EXPORTS = '''
+SELECT channel_id, kind, path, last_message_id, message_count, file_offset, group_author_id, group_time
+FROM transcript_exports WHERE channel_id = ?
+'''
+
+SQL_TRANSCRIPT_EXPORT_KINDS = 'SELECT channel_id, kind FROM transcript_exports'
+
+SQL_SAVE_TRANSCRIPT_EXPORT = '''
+INSERT OR REPLACE INTO transcript_exports
+(channel_id, kind, path, last_message_id, message_count, file_offset, group_author_id, group_time, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_DELETE_TRANSCRIPT_EXPORT = 'DELETE FROM transcript_exports WHERE channel_id = ? AND kind = ?'
+
+async def get_transcript_export(channel_id: int, kind: str) -> Optional[TranscriptExport]:
+    """Get the resume cursor of an unfinished export"""
+    row = await database.fetchone(SQL_TRANSCRIPT_EXPORT, (channel_id, kind))
+    return TranscriptExport(*row) if row else None
+
+async def get_channel_transcript_exports(channel_id: int) -> List[TranscriptExport]:
+    """Get the resume cursors of every kind of export of a channel"""
+    rows = await database.fetchall(SQL_CHANNEL_TRANSCRIPT_EXPORTS, (channel_id,))
+    return [TranscriptExport(*row) for row in rows]
+
+async def get_transcript_export_kinds() -> List[Tuple[int, str]]:
+    """Get the channel and kind of every saved export cursor"""
+    return await database.fetchall(SQL_TRANSCRIPT_EXPORT_KINDS)
+
+async def save_transcript_export(export: TranscriptExport):
+    """Store the resume cursor of an export"""
+    await database.execute(SQL_SAVE_TRANSCRIPT_EXPORT, (
+        export.channel_id, export.kind, export.path, export.last_message_id, export.message_count,
+        export.file_offset, export.group_author_id, export.group_time, _now()
+    ))
+
+async def delete_transcript_export(channel_id: int, kind: str):
+    """Forget the resume cursor of a finished export"""
+    await database.execute(SQL_DELETE_TRANSCRIPT_EXPORT, (channel_id, kind))
+
+# Captured messages
+
+_CAPTURED_COLUMNS = ('message_id, channel_id, author_id, author_name, avatar_url, author_color, '
+                     'author_bot, content, embeds, attachments, created_at')
+
+SQL_SAVE_CAPTURED_MESSAGE = f'''
+INSERT OR REPLACE INTO captured_messages ({_CAPTURED_COLUMNS})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Edits only carry the parts of a message that changed, None keeps the rest
+SQL_UPDATE_CAPTURED_MESSAGE = '''
+UPDATE captured_messages
+SET content = COALESCE(?, content), embeds = COALESCE(?, embeds), attachments = COALESCE(?, attachments)
+WHERE message_id = ?
+'''
+
+SQL_DELETE_CAPTURED_MESSAGE = 'DELETE FROM captured_messages WHERE message_id = ?'
+
+SQL_CAPTURED_MESSAGES = f'''
+SELECT {_CAPTURED_COLUMNS} FROM captured_messages
+WHERE channel_id = ? AND message_id > ?
+ORDER BY message_id LIMIT ?
+'''
+
+SQL_MARK_CHANNEL_CAPTURED = 'INSERT OR IGNORE INTO captured_channels (channel_id, captured_since) VALUES (?, ?)'
+
+SQL_CHANNEL_CAPTURED = 'SELECT 1 FROM captured_channels WHERE channel_id = ?'
+
+SQL_CAPTURE_CURSORS = '''
+SELECT c.channel_id, cc.channel_id IS NOT NULL,
+       (SELECT MAX(m.message_id) FROM captured_messages m WHERE m.channel_id = c.channel_id)
+FROM cases c LEFT JOIN captured_channels cc ON cc.channel_id = c.channel_id
+WHERE c.status IN ('Åpen', 'Under behandling') AND c.channel_id IS NOT NULL
+'''
+
+SQL_FORGET_CAPTURED_MESSAGES = 'DELETE FROM captured_messages WHERE channel_id = ?'
+
+SQL_FORGET_CAPTURED_CHANNEL = 'DELETE FROM captured_channels WHERE channel_id = ?'
+
+def _captured_params(message: CapturedMessage) -> tuple:
+    return (message.message_id, message.channel_id, message.author_id, message.author_name, message.avatar_url,
+            message.author_color, message.author_bot, message.content, message.embeds, message.attachments,
+            message.created_at)
+
+async def save_captured_messages(messages: List[CapturedMessage]):
+    """Store new or replaced messages in one commit"""
+    if messages:
+        await database.executemany(SQL_SAVE_CAPTURED_MESSAGE, [_captured_params(m) for m in messages])
+
+async def update_captured_message(message_id: int, content: Optional[str],
+                                  embeds: Optional[str], attachments: Optional[str]):
+    """Apply an edit to a stored message, None leaves a part unchanged"""
+    await database.execute(SQL_UPDATE_CAPTURED_MESSAGE, (content, embeds, attachments, message_id))
+
+async def delete_captured_messages(message_ids: List[int]):
+    """Remove deleted messages from the store"""
+    if message_ids:
+        await database.executemany(SQL_DELETE_CAPTURED_MESSAGE, [(i,) for i in message_ids])
+
+async def get_captured_messages(channel_id: int, after_id: int, limit: int) -> List[CapturedMessage]:
+    """Get stored messages of a channel after a message ID, oldest first"""
+    rows = await database.fetchall(SQL_CAPTURED_MESSAGES, (channel_id, after_id, limit))
+    return [CapturedMessage(*row) for row in rows]
+
+async def mark_channel_captured(channel_id: int):
+    """Record that the whole history of a channel is in the store"""
+    await database.execute(SQL_MARK_CHANNEL_CAPTURED, (channel_id, _now()))
+
+async def is_channel_captured(channel_id: int) -> bool:
+    """Check if the whole history of a channel is in the store"""
+    return await database.fetchone(SQL_CHANNEL_CAPTURED, (channel_id,)) is not None
+
+async def get_capture_cursors() -> List[CaptureCursor]:
+    """Get how far capture has got in every active case channel"""
+    rows = await database.fetchall(SQL_CAPTURE_CURSORS)
+    return [CaptureCursor(row[0], bool(row[1]), row[2]) for row in rows]
+
+def _forget_captured_channel(conn, channel_id):
+    conn.execute(SQL_FORGET_CAPTURED_MESSAGES, (channel_id,))
+    conn.execute(SQL_FORGET_CAPTURED_CHANNEL, (channel_id,))
+
+async def forget_captured_channel(channel_id: int):
+    """Drop the stored messages of a channel"""
+    await database.write(_forget_captured_channel, channel_id)
+
+# Scheduled notifications
+
+_NOTIFICATION_COLUMNS = 'id, target_user_id, message, scheduled_time, created_by, sent'
+
+SQL_INSERT_NOTIFICATION = '''
+INSERT INTO scheduled_notifications (target_user_id, message, scheduled_time, created_by)
+VALUES (?, ?, ?, ?)
+'''
+
+SQL_NOTIFICATION_BY_ID = f'SELECT {_NOTIFICATION_COLUMNS} FROM scheduled_notifications WHERE id = ?'
+
+SQL_DELETE_NOTIFICATION = 'DELETE FROM scheduled_notifications WHERE id = ?'
+
+SQL_PENDING_NOTIFICATIONS = f'''
+SELECT {_NOTIFICATION_COLUMNS} FROM scheduled_notifications WHERE sent = 0 ORDER BY scheduled_time
+'''
+
+SQL_DUE_NOTIFICATIONS = f'''
+SELECT {_NOTIFICATION_COLUMNS} FROM scheduled_notifications
+WHERE scheduled_time <= ? AND sent = 0
+'''
+
+SQL_MARK_NOTIFICATION_SENT = 'UPDATE scheduled_notifications SET sent = 1 WHERE id = ?'
+
+async def schedule_notification(target_user_id: int, message: str, scheduled_time: str, created_by: int) -> int:
+    """Store a scheduled notification and return its ID"""
+    cursor = await database.execute(SQL_INSERT_NOTIFICATION, (target_user_id, message, scheduled_time, created_by))
+    return cursor.lastrowid
+
+async def get_notification(notification_id: int) -> Optional[ScheduledNotification]:
+    """Get a scheduled notification by ID"""
+    row = await database.fetchone(SQL_NOTIFICATION_BY_ID, (notification_id,))
+    return ScheduledNotification(*row) if row else None
+
+async def delete_notification(notification_id: int):
+    """Delete a scheduled notification"""
+    await database.execute(SQL_DELETE_NOTIFICATION, (notification_id,))
+
+async def get_pending_notifications() -> List[ScheduledNotification]:
+    """Get all notifications that have not been sent, soonest first"""
+    rows = await database.fetchall(SQL_PENDING_NOTIFICATIONS)
+    return [ScheduledNotification(*row) for row in rows]
+
+async def get_due_notifications() -> List[ScheduledNotification]:
+    """Get all unsent notifications whose time has come"""
+    rows = await database.fetchall(SQL_DUE_NOTIFICATIONS, (_now(),))
+    return [ScheduledNotification(*row) for row in rows]
+
+async def mark_notifications_sent(notification_ids: List[int]):
+    """Mark notifications as sent in a single commit"""
+    if notification_ids:
+        await database.executemany(SQL_MARK_NOTIFICATION_SENT, [(i,) for i in notification_ids])
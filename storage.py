@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import logging
+import threading
+from typing import Optional
+from config import DATABASE
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Storage")
+
+def _apply_pragmas(conn: sqlite3.Connection, journal_mode: str):
+    """Apply the configured connection pragmas"""
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {DATABASE['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(DATABASE['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(DATABASE['mmap_size'])}")
+    conn.execute(f"PRAGMA busy_timeout = {int(DATABASE['busy_timeout'])}")
+
+class StorageBackend:
+    """
+    Where the database lives
+
+    The database module asks its backend for every connection it opens, so
+    the rest of the bot never needs to know whether the data is on disk or
+    in memory.
+    """
+
+    name = "base"
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a read-write connection"""
+        raise NotImplementedError
+
+    def connect_snapshot(self) -> sqlite3.Connection:
+        """Open a read-only connection for reporting queries"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release anything the backend holds on to, used on shutdown"""
+
+class SQLiteFileBackend(StorageBackend):
+    """A SQLite database file on disk"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self) -> sqlite3.Connection:
+        # Create database directory if it doesn't exist
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DATABASE["busy_timeout"] / 1000,
+            check_same_thread=False
+        )
+        _apply_pragmas(conn, DATABASE["journal_mode"])
+        return conn
+
+    def connect_snapshot(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            timeout=DATABASE["busy_timeout"] / 1000,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = {int(DATABASE['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(DATABASE['mmap_size'])}")
+        conn.execute(f"PRAGMA busy_timeout = {int(DATABASE['busy_timeout'])}")
+        return conn
+
+class MemoryBackend(StorageBackend):
+    """
+    A shared-cache in-memory database, for tests and benchmarks
+
+    Every connection opens the same named in-memory database. An anchor
+    connection keeps it alive for as long as the backend is open, and the
+    data is gone once the backend is closed. Reads do not take table locks,
+    so snapshot reads are not isolated from concurrent writes.
+    """
+
+    name = "memory"
+
+    def __init__(self, name: str = "courtbot"):
+        self.uri = f"file:{name}?mode=memory&cache=shared"
+        self._anchor: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._anchor is None:
+                self._anchor = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        # Shared-cache connections lock whole tables and do not honour
+        # busy_timeout, so readers must not take read locks
+        conn.execute("PRAGMA read_uncommitted = ON")
+        return conn
+
+    def connect(self) -> sqlite3.Connection:
+        conn = self._open()
+        # WAL needs a file, memory journaling is the fastest that works
+        _apply_pragmas(conn, "MEMORY")
+        return conn
+
+    def connect_snapshot(self) -> sqlite3.Connection:
+        conn = self._open()
+        conn.isolation_level = None
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._anchor is not None:
+                self._anchor.close()
+                self._anchor = None
+
+def create_backend() -> StorageBackend:
+    """Create the storage backend selected in config.DATABASE['backend']"""
+    kind = DATABASE.get("backend", "sqlite")
+    if kind == "sqlite":
+        return SQLiteFileBackend(DATABASE["path"])
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{kind}'")
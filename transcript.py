@@ -0,0 +1,670 @@
+"""
+Streaming channel transcripts
+
+Messages are grouped in a single pass as they come off channel.history():
+consecutive messages from the same author, at most GROUP_GAP_SECONDS apart,
+form a group. Each piece of HTML is written to the output as soon as it is
+known, so only the messages since the last checkpoint are held in memory
+however long the channel is. Every exporter, /eksporter-sak, closing a case and
+/arkiver-legacy, renders through the same templates and escaping.
+
+An export pages through the whole channel. Every few hundred messages the
+file is flushed and a resume cursor is saved in the transcript_exports
+table: the last message written, the file size at that point and the open
+group. An export that is interrupted, by an error or a crash, continues
+from the cursor the next time it is started, after cutting the file back to
+the saved size.
+
+With live capture on, exports of captured channels read the local message
+store instead of Discord, so they make no API calls.
+"""
+import asyncio
+import datetime
+import html
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import string
+import time
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, TextIO, Tuple
+import discord
+from config import TRANSCRIPTS
+import cache
+import repository
+
+# Set up logging
+logger = logging.getLogger("CourtBot.Transcript")
+
+# Longest pause between two messages from the same author in one group
+GROUP_GAP_SECONDS = 300
+
+# Transcripts are written in many small pieces, so buffer them generously
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# Called with the number of messages written so far
+Progress = Callable[[int], Awaitable[None]]
+
+def role_color(author: discord.abc.User) -> str:
+    """Get the colour an author's name is shown in, black for bots and uncoloured members"""
+    color = getattr(author, "color", None)
+    if author.bot or color is None or color == discord.Color.default():
+        return "#000000"
+    return f"#{color.value:06x}"
+
+def open_output(path: str, mode: str = "w") -> TextIO:
+    """Open a transcript file for writing"""
+    return open(path, mode, encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+
+# Templates
+#
+# Each template is split into literal text and placeholders once, when the
+# module is imported, so rendering is a single join. Values are inserted
+# as they are; escape anything that comes from Discord with escape() or
+# format_text() first.
+
+class Template:
+    """A text template with {name} placeholders, parsed once"""
+
+    def __init__(self, text: str):
+        self.parts: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(text)
+        ]
+
+    def render(self, **values: Any) -> str:
+        """Fill in the placeholders"""
+        return "".join(
+            literal if field is None else f"{literal}{values[field]}"
+            for literal, field in self.parts
+        )
+
+STYLE = """
+body { font-family: Arial, sans-serif; margin: 20px; background-color: #f9f9f9; color: #333; }
+.header { background-color: #f2f2f2; padding: 20px; border-radius: 5px; margin-bottom: 20px; border: 1px solid #ddd; }
+.evidence { background-color: #e6f7ff; padding: 15px; border-radius: 5px; margin-bottom: 15px; border: 1px solid #b8e2f2; }
+.messages { border: 1px solid #ddd; border-radius: 5px; overflow: hidden; }
+.message-group { padding: 15px; border-bottom: 1px solid #eee; display: flex; }
+.message-group:nth-child(odd) { background-color: #f9f9f9; }
+.message-group:nth-child(even) { background-color: #fff; }
+.message-avatar { width: 40px; height: 40px; border-radius: 50%; margin-right: 15px; }
+.message-content { flex: 1; }
+.message-header { display: flex; justify-content: space-between; margin-bottom: 5px; }
+.message-author { font-weight: bold; }
+.message-timestamp { color: #777; font-size: 12px; }
+.message-text { margin-bottom: 10px; }
+.message-item { margin-bottom: 8px; }
+.attachment { background-color: #f0f0f0; padding: 8px; margin-top: 5px; border-radius: 3px; display: inline-block; }
+.embed { background-color: #f0f0f0; padding: 10px; margin-top: 10px; border-radius: 5px; border-left: 4px solid #7289da; }
+.embed-title { font-weight: bold; margin-bottom: 5px; }
+.embed-description { margin-bottom: 10px; }
+.embed-field { margin-top: 5px; }
+.embed-field-name { font-weight: bold; }
+.footer { margin-top: 20px; text-align: center; color: #777; font-size: 12px; }
+h1, h2 { color: #2c3e50; }
+a { color: #3498db; text-decoration: none; }
+a:hover { text-decoration: underline; }
+"""
+
+PAGE_START = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>{title}</title>
+<style>{style}</style>
+</head>
+<body>
+<div class="header">
+<h1>{title}</h1>
+{details}
+</div>
+{sections}
+<h2>Meldinger</h2>
+<div class="messages">
+""")
+
+DETAIL = Template("<p><strong>{label}:</strong> {value}</p>\n")
+
+SECTION = Template("<h2>{title}</h2>\n{body}\n")
+
+EVIDENCE = Template("""<div class="evidence">
+<h3>Bevis #{case_id}.{ordinal} - {description}</h3>
+<p><strong>Link:</strong> <a href="{link}" target="_blank">{link}</a></p>
+<p><strong>Lagt til:</strong> {submitted_at}</p>
+</div>
+""")
+
+GROUP_START = Template("""<div class="message-group">
+<img class="message-avatar" src="{avatar}" alt="{author}">
+<div class="message-content">
+<div class="message-header">
+<span class="message-author" style="color: {color};">{author}</span>
+<span class="message-timestamp">{timestamp}</span>
+</div>
+""")
+
+MESSAGE_START = Template("""<div class="message-item">
+<div class="message-text">{content}</div>
+""")
+
+EMBED_START = '<div class="embed">'
+EMBED_TITLE = Template('<div class="embed-title">{title}</div>')
+EMBED_DESCRIPTION = Template('<div class="embed-description">{description}</div>')
+EMBED_FIELD = Template('<div class="embed-field"><div class="embed-field-name">{name}</div><div class="embed-field-value">{value}</div></div>')
+EMBED_END = "</div>\n"
+
+ATTACHMENT = Template("""<div class="attachment"><a href="{url}" target="_blank">{url}</a></div>
+""")
+
+MESSAGE_END = "</div>\n"
+
+GROUP_END = "</div>\n</div>\n"
+
+PAGE_END = """</div>
+<div class="footer">Generert av Oslo Tingrett</div>
+</body>
+</html>
+"""
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Discord markdown, applied to text that has already been escaped
+_MARKDOWN = [
+    (re.compile(r"\*\*(.+?)\*\*", re.DOTALL), r"<strong>\1</strong>"),
+    (re.compile(r"__(.+?)__", re.DOTALL), r"<u>\1</u>"),
+    (re.compile(r"~~(.+?)~~", re.DOTALL), r"<del>\1</del>"),
+    (re.compile(r"\*(.+?)\*", re.DOTALL), r"<em>\1</em>"),
+]
+
+def escape(text: Optional[str]) -> str:
+    """Escape text for HTML, None becomes an empty string"""
+    return html.escape(text) if text else ""
+
+def format_text(text: Optional[str]) -> str:
+    """Escape message text and convert Discord markdown and line breaks to HTML"""
+    text = escape(text)
+    for pattern, replacement in _MARKDOWN:
+        text = pattern.sub(replacement, text)
+    return text.replace("\n", "<br>")
+
+class TranscriptRenderer:
+    """
+    Renders a transcript document
+
+    Subclasses supply the title, the details at the top and any sections
+    before the messages. Groups, messages and embeds look the same in every
+    transcript.
+    """
+
+    # Bot embeds whose title has none of these words are notifications left out
+    # of the transcript, or None to keep every message
+    embed_keywords: Optional[Sequence[str]] = None
+
+    def title(self) -> str:
+        """Title of the document, unescaped"""
+        raise NotImplementedError
+
+    async def details(self) -> List[Tuple[str, str]]:
+        """Label and unescaped value of each line in the header"""
+        return []
+
+    async def sections(self) -> str:
+        """HTML between the header and the messages"""
+        return ""
+
+    async def header(self) -> str:
+        """HTML before the first message"""
+        details = "".join(
+            DETAIL.render(label=escape(label), value=escape(None if value is None else str(value)))
+            for label, value in await self.details()
+        )
+        return PAGE_START.render(
+            title=escape(self.title()), style=STYLE, details=details, sections=await self.sections()
+        )
+
+    def footer(self) -> str:
+        """HTML after the last message"""
+        return PAGE_END
+
+    def include(self, message: discord.Message) -> bool:
+        """Check if a message belongs in the transcript"""
+        if self.embed_keywords is None or not (message.author.bot and message.embeds):
+            return True
+        title = (message.embeds[0].title or "").lower()
+        return any(keyword in title for keyword in self.embed_keywords)
+
+    def group_start(self, message: discord.Message) -> str:
+        """HTML that opens a group, from the group's first message"""
+        author = message.author
+        return GROUP_START.render(
+            avatar=escape(str(author.display_avatar.url)),
+            author=escape(author.display_name),
+            color=role_color(author),
+            timestamp=message.created_at.strftime(TIMESTAMP_FORMAT)
+        )
+
+    def message(self, message: discord.Message) -> str:
+        """HTML for one message inside a group"""
+        parts = [MESSAGE_START.render(content=format_text(message.content))]
+
+        for embed in message.embeds:
+            parts.append(EMBED_START)
+            if embed.title:
+                parts.append(EMBED_TITLE.render(title=escape(embed.title)))
+            if embed.description:
+                parts.append(EMBED_DESCRIPTION.render(description=format_text(embed.description)))
+            for field in embed.fields:
+                parts.append(EMBED_FIELD.render(name=escape(field.name), value=format_text(field.value)))
+            parts.append(EMBED_END)
+
+        for attachment in message.attachments:
+            parts.append(ATTACHMENT.render(url=escape(attachment.url)))
+
+        parts.append(MESSAGE_END)
+        return "".join(parts)
+
+    def group_end(self) -> str:
+        """HTML that closes a group"""
+        return GROUP_END
+
+class CaseTranscript(TranscriptRenderer):
+    """The export of a case, used by /eksporter-sak and when a case is closed"""
+
+    # System notifications are left out, except these
+    embed_keywords = ("tildelt", "lukket", "arkivert", "bevis")
+
+    def __init__(self, channel: discord.TextChannel, case: repository.Case):
+        self.channel = channel
+        self.case = case
+
+    def title(self) -> str:
+        return f"Sak #{self.case.id} - {self.case.title}"
+
+    async def details(self) -> List[Tuple[str, str]]:
+        case = self.case
+
+        # Get assigned judge if any
+        judge_name = "Ingen"
+        if case.assigned_judge_id and await cache.judges.is_judge(case.assigned_judge_id):
+            judge_name = await cache.members.name(self.channel.guild, case.assigned_judge_id, judge_name)
+
+        return [
+            ("Beskrivelse", case.description),
+            ("Status", case.status),
+            ("Opprettet", case.created_at),
+            ("Tildelt dommer", judge_name),
+        ]
+
+    async def sections(self) -> str:
+        evidence_list = await repository.get_evidence(self.case.id)
+        if evidence_list:
+            body = "".join(
+                EVIDENCE.render(
+                    case_id=self.case.id,
+                    ordinal=evidence.ordinal,
+                    description=escape(evidence.description),
+                    link=escape(evidence.link),
+                    submitted_at=escape(evidence.submitted_at)
+                )
+                for evidence in evidence_list
+            )
+        else:
+            body = "<p>Ingen bevis registrert for denne saken.</p>"
+        return SECTION.render(title="Bevis", body=body)
+
+class LegacyTranscript(TranscriptRenderer):
+    """The archive of a channel from the old ticket system, used by /arkiver-legacy"""
+
+    def __init__(self, channel: discord.TextChannel, archived_by: discord.abc.User,
+                 title: str, description: str):
+        self.channel = channel
+        self.archived_by = archived_by
+        self.archive_title = title
+        self.description = description
+
+    def title(self) -> str:
+        return f"Legacy Arkiv: {self.archive_title}"
+
+    async def details(self) -> List[Tuple[str, str]]:
+        return [
+            ("Beskrivelse", self.description),
+            ("Kanal", self.channel.name),
+            ("Arkivert av", self.archived_by.display_name),
+            ("Arkivert", datetime.datetime.now().strftime(TIMESTAMP_FORMAT)),
+        ]
+
+class TranscriptWriter:
+    """Groups messages and writes them to a transcript as they arrive"""
+
+    def __init__(self, out: TextIO, renderer: TranscriptRenderer,
+                 author_id: Optional[int] = None, last_time: Optional[datetime.datetime] = None):
+        """
+        Args:
+            out: Where the HTML is written
+            renderer: Renders the groups and messages
+            author_id: Author of a group left open by an earlier run
+            last_time: Time of the last message in that group
+        """
+        self.out = out
+        self.renderer = renderer
+        self.author_id = author_id
+        self.last_time = last_time
+
+    def write(self, message: discord.Message) -> bool:
+        """
+        Write a message, opening a new group when needed
+
+        Returns:
+            bool: True if the message was written, False if the renderer left it out
+        """
+        if not self.renderer.include(message):
+            return False
+
+        if (self.author_id != message.author.id or
+                (message.created_at - self.last_time).total_seconds() > GROUP_GAP_SECONDS):
+            if self.author_id is not None:
+                self.out.write(self.renderer.group_end())
+            self.out.write(self.renderer.group_start(message))
+
+        self.out.write(self.renderer.message(message))
+        self.author_id = message.author.id
+        self.last_time = message.created_at
+        return True
+
+    def finish(self):
+        """Close the open group"""
+        if self.author_id is not None:
+            self.out.write(self.renderer.group_end())
+            self.author_id = None
+
+# Captured messages
+#
+# With TRANSCRIPTS["live_capture"] on, the Capture cog stores every message
+# in a case channel as it is posted. Only what a transcript shows is kept:
+# the author as they looked at the time, the text, embed titles,
+# descriptions and fields, and attachment URLs.
+
+# Stored messages read per query while exporting
+STORE_PAGE_SIZE = 500
+
+def compact_embeds(embeds: Sequence[dict]) -> Optional[str]:
+    """The parts of embed dicts a transcript shows, as JSON, or None without embeds"""
+    compact = []
+    for embed in embeds:
+        item = {key: embed[key] for key in ("title", "description") if embed.get(key)}
+        fields = [{"name": f.get("name", ""), "value": f.get("value", "")} for f in embed.get("fields", [])]
+        if fields:
+            item["fields"] = fields
+        compact.append(item)
+    return json.dumps(compact, ensure_ascii=False) if compact else None
+
+def compact_attachments(urls: Sequence[str]) -> Optional[str]:
+    """Attachment URLs as JSON, or None without attachments"""
+    return json.dumps(list(urls)) if urls else None
+
+def capture(message: discord.Message) -> repository.CapturedMessage:
+    """Turn a message into a row for the message store"""
+    author = message.author
+    color = getattr(author, "color", None)
+    return repository.CapturedMessage(
+        message.id, message.channel.id, author.id, author.display_name, str(author.display_avatar.url),
+        color.value if color else 0, author.bot, message.content,
+        compact_embeds([embed.to_dict() for embed in message.embeds]),
+        compact_attachments([attachment.url for attachment in message.attachments]),
+        message.created_at.isoformat()
+    )
+
+class _StoredAsset:
+    __slots__ = ('url',)
+
+    def __init__(self, url: str):
+        self.url = url
+
+class _StoredAuthor:
+    __slots__ = ('id', 'display_name', 'display_avatar', 'color', 'bot')
+
+    def __init__(self, row: repository.CapturedMessage):
+        self.id = row.author_id
+        self.display_name = row.author_name
+        self.display_avatar = _StoredAsset(row.avatar_url or "")
+        self.color = discord.Color(row.author_color or 0)
+        self.bot = bool(row.author_bot)
+
+class StoredMessage:
+    """A captured message, with the attributes of discord.Message a transcript reads"""
+    __slots__ = ('id', 'author', 'content', 'embeds', 'attachments', 'created_at')
+
+    def __init__(self, row: repository.CapturedMessage):
+        self.id = row.message_id
+        self.author = _StoredAuthor(row)
+        self.content = row.content or ""
+        self.embeds = [discord.Embed.from_dict(embed) for embed in json.loads(row.embeds)] if row.embeds else []
+        self.attachments = [_StoredAsset(url) for url in json.loads(row.attachments)] if row.attachments else []
+        self.created_at = datetime.datetime.fromisoformat(row.created_at)
+
+async def stored_history(channel_id: int, after_id: Optional[int]) -> AsyncIterator[StoredMessage]:
+    """Read the captured messages of a channel after a message ID, oldest first"""
+    after_id = after_id or 0
+    while True:
+        rows = await repository.get_captured_messages(channel_id, after_id, STORE_PAGE_SIZE)
+        for row in rows:
+            yield StoredMessage(row)
+        if len(rows) < STORE_PAGE_SIZE:
+            return
+        after_id = rows[-1].message_id
+
+# Exports
+#
+# The grouped messages of an export are written to a body file that only
+# ever grows. The delivered document is put together from a header rendered
+# at delivery time, a copy of the body and the footer, so a changed status
+# or new evidence never needs the messages to be rendered again.
+
+# Held while an export runs or is discarded, one per channel and kind. A lock
+# is dropped once no export or discard is holding or waiting for it
+_locks: "weakref.WeakValueDictionary[Tuple[int, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _lock(channel_id: int, kind: str) -> asyncio.Lock:
+    return _locks.setdefault((channel_id, kind), asyncio.Lock())
+
+# Kinds of export with a saved cursor, by channel, so edits and deletes in
+# other channels need no query. Until load_exports() has run every channel
+# is looked up
+_exports: Dict[int, Set[str]] = {}
+_exports_loaded = False
+
+async def load_exports():
+    """Load which channels have a saved export cursor, used at startup"""
+    global _exports_loaded
+    for channel_id, kind in await repository.get_transcript_export_kinds():
+        _exports.setdefault(channel_id, set()).add(kind)
+    _exports_loaded = True
+    logger.info(f"Loaded export cursors of {len(_exports)} channel(s)")
+
+def _forget(channel_id: int, kind: str):
+    kinds = _exports.get(channel_id)
+    if kinds is not None:
+        kinds.discard(kind)
+        if not kinds:
+            del _exports[channel_id]
+
+def _paths(channel_id: int, kind: str) -> Tuple[str, str]:
+    """Paths of the body file and the delivered document of an export"""
+    base = os.path.join(TRANSCRIPTS["directory"], f"{kind}-{channel_id}")
+    return f"{base}.body.html", f"{base}.html"
+
+def _create(path: str):
+    """Create an empty body file, run in a worker thread"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open_output(path).close()
+
+def _truncate(path: str, size: int):
+    """Cut a body file back to a checkpoint, run in a worker thread"""
+    with open(path, "r+b") as file:
+        file.truncate(size)
+
+def _append(path: str, text: str, sync: bool = True) -> int:
+    """
+    Append to a body file, run in a worker thread
+
+    Args:
+        path: The body file
+        text: What was written since the last checkpoint
+        sync: Whether to fsync, so the cursor saved next never points past the disk
+
+    Returns:
+        int: The size of the file afterwards
+    """
+    with open(path, "ab") as file:
+        file.write(text.encode("utf-8"))
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+        return file.tell()
+
+def _assemble(document_path: str, header: str, body_path: str, footer: str):
+    """Put the delivered document together from its parts, run in a worker thread"""
+    with open_output(document_path) as out:
+        out.write(header)
+        with open(body_path, encoding="utf-8") as body:
+            shutil.copyfileobj(body, out, WRITE_BUFFER_SIZE)
+        out.write(footer)
+
+async def _start(channel: discord.abc.Messageable, kind: str) -> repository.TranscriptExport:
+    """Create the empty body of a new export and save its first cursor"""
+    body_path, _ = _paths(channel.id, kind)
+    await asyncio.to_thread(_create, body_path)
+    state = repository.TranscriptExport(channel.id, kind, body_path, None, 0, 0, None, None)
+    await repository.save_transcript_export(state)
+    return state
+
+async def _checkpoint(buffer: io.StringIO, state: repository.TranscriptExport, writer: TranscriptWriter):
+    """Write out what has been rendered and save the cursor that points past it"""
+    state.file_offset = await asyncio.to_thread(_append, state.path, buffer.getvalue())
+    buffer.seek(0)
+    buffer.truncate()
+    state.group_author_id = writer.author_id
+    state.group_time = writer.last_time.isoformat() if writer.last_time else None
+    await repository.save_transcript_export(state)
+
+async def export(channel: discord.abc.Messageable, kind: str, renderer: TranscriptRenderer,
+                 progress: Optional[Progress] = None) -> Tuple[str, int]:
+    """
+    Export the whole history of a channel, continuing from the last run
+
+    The body and cursor are kept until discard() is called. Running the same
+    export again, after an interruption or to refresh a delivered export,
+    only renders messages posted since the last run. Messages are rendered
+    into memory between checkpoints, and all file I/O runs in worker threads
+    so the event loop never waits on the disk.
+
+    Args:
+        channel: The channel to export
+        kind: Which export this is, one cursor is kept per channel and kind
+        renderer: Renders the header, messages and footer
+        progress: Called every TRANSCRIPTS["progress_seconds"] with the messages written so far
+
+    Returns:
+        Tuple[str, int]: Path of the finished document and the number of messages in it
+    """
+    async with _lock(channel.id, kind):
+        state = await repository.get_transcript_export(channel.id, kind)
+        if state and not os.path.exists(state.path):
+            logger.warning(f"Export file {state.path} is gone, starting the {kind} export of {channel.id} over")
+            state = None
+
+        if state is None:
+            state = await _start(channel, kind)
+        else:
+            logger.info(f"Continuing {kind} export of {channel.id} after {state.message_count} message(s)")
+            # Drop anything written after the last checkpoint, including the closed last group
+            await asyncio.to_thread(_truncate, state.path, state.file_offset)
+        _exports.setdefault(channel.id, set()).add(kind)
+
+        group_time = datetime.datetime.fromisoformat(state.group_time) if state.group_time else None
+
+        # Read from the message store when it has the whole channel, from Discord otherwise
+        if TRANSCRIPTS["live_capture"] and await repository.is_channel_captured(channel.id):
+            history = stored_history(channel.id, state.last_message_id)
+        else:
+            after = discord.Object(id=state.last_message_id) if state.last_message_id else None
+            history = channel.history(limit=None, after=after, oldest_first=True)
+        checkpoint_every = TRANSCRIPTS["checkpoint_messages"]
+        last_report = time.monotonic()
+        previous_count = state.message_count
+        pending = 0
+
+        buffer = io.StringIO()
+        writer = TranscriptWriter(buffer, renderer, state.group_author_id, group_time)
+
+        async for message in history:
+            if writer.write(message):
+                state.message_count += 1
+            state.last_message_id = message.id
+            pending += 1
+
+            if pending >= checkpoint_every:
+                await _checkpoint(buffer, state, writer)
+                pending = 0
+
+            if progress and time.monotonic() - last_report >= TRANSCRIPTS["progress_seconds"]:
+                last_report = time.monotonic()
+                await progress(state.message_count)
+
+        # The cursor points before the end of the open group, so a later run can carry on
+        await _checkpoint(buffer, state, writer)
+        writer.finish()
+        await asyncio.to_thread(_append, state.path, buffer.getvalue(), False)
+
+        _, document_path = _paths(channel.id, kind)
+        await asyncio.to_thread(_assemble, document_path, await renderer.header(), state.path, renderer.footer())
+
+    logger.info(
+        f"Exported {state.message_count} message(s) from {channel.id} to {document_path}, "
+        f"{state.message_count - previous_count} new"
+    )
+    return document_path, state.message_count
+
+def _remove(paths: Sequence[str]):
+    """Delete export files, run in a worker thread"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing export file {path}: {e}")
+
+async def discard(channel_id: int, kind: str):
+    """Delete the files and cursor of an export"""
+    async with _lock(channel_id, kind):
+        await asyncio.to_thread(_remove, _paths(channel_id, kind))
+        await repository.delete_transcript_export(channel_id, kind)
+        _forget(channel_id, kind)
+
+async def discard_if_stale(channel_id: int, message_ids: Sequence[int]):
+    """
+    Discard every export of a channel that already contains one of these edited or deleted messages
+
+    Covers kept exports as well as interrupted ones of any kind, which would
+    otherwise resume on top of the old version of the messages.
+
+    Args:
+        channel_id: The channel the messages are in
+        message_ids: The edited or deleted messages
+    """
+    if _exports_loaded and channel_id not in _exports:
+        return
+    for state in await repository.get_channel_transcript_exports(channel_id):
+        if state.last_message_id and min(message_ids) <= state.last_message_id:
+            logger.info(f"Messages in {channel_id} changed after its {state.kind} export, discarding it")
+            await discard(channel_id, state.kind)
+
+async def discard_channel(channel_id: int):
+    """Discard every export of a deleted channel"""
+    if _exports_loaded and channel_id not in _exports:
+        return
+    for state in await repository.get_channel_transcript_exports(channel_id):
+        await discard(channel_id, state.kind)
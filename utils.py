@@ -1,12 +1,6 @@
 import discord
-import sqlite3
 from typing import Optional, List, Union
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect('data/courtbot.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+import cache
 
 async def has_role_permission(user: discord.Member, function: str) -> bool:
     """
@@ -27,24 +21,14 @@ async def has_role_permission(user: discord.Member, function: str) -> bool:
     if user.guild_permissions.administrator:
         return True
     
-    # Get the role ID for the function from the database
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute('''
-    SELECT role_id FROM role_permissions 
-    WHERE function = ? AND guild_id = ?
-    ''', (function, user.guild.id))
-    
-    result = c.fetchone()
-    conn.close()
+    # Get the role ID for the function from the permission cache
+    role_id = await cache.permissions.get_role_id(user.guild.id, function)
     
-    if not result:
+    if role_id is None:
         # If no role is set for this function, default to requiring administrator
         return user.guild_permissions.administrator
     
     # Check if the user has the required role
-    role_id = result['role_id']
     role = user.guild.get_role(role_id)
     
     if not role: